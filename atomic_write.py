@@ -0,0 +1,95 @@
+from contextlib import contextmanager
+import os
+import json
+import uuid
+
+
+def temp_path(file_path):
+    """
+    gets a unique temporary path next to a file, so concurrent writers
+    of the same file never share it\n
+    params:
+        str file_path: destination path
+    return:
+        tmp_path: str
+    """
+    folder = os.path.dirname(file_path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    return f"{file_path}.{uuid.uuid4().hex[:12]}.tmp"
+
+
+def commit_temp(tmp_path, file_path):
+    """
+    flushes a fully written temporary file to disk then renames it
+    over the destination in one step\n
+    params:
+        str tmp_path: path from temp_path
+        str file_path: destination path
+    """
+    with open(tmp_path, 'ab') as f:
+        os.fsync(f.fileno())
+    os.replace(tmp_path, file_path)
+
+
+@contextmanager
+def atomic_path(file_path):
+    """
+    gives a temporary path to write, replacing the file once the block
+    ends, for writers that only take a path\n
+    params:
+        str file_path: destination path
+    return:
+        tmp_path: str
+    """
+    tmp_path = temp_path(file_path)
+    try:
+        yield tmp_path
+        commit_temp(tmp_path, file_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+@contextmanager
+def atomic_file(file_path, mode='w'):
+    """
+    opens a temporary file to write, replacing the file once the block
+    ends, so a crash never leaves a half written file\n
+    params:
+        str file_path: destination path
+        str mode: 'w' or 'wb'
+    return:
+        f: file object
+    """
+    tmp_path = temp_path(file_path)
+    try:
+        with open(tmp_path, mode) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, file_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def write_file_atomic(file_path, text):
+    """
+    writes text to a temporary file then renames it\n
+    params:
+        str file_path: destination path
+        str or bytes text: file content
+    """
+    with atomic_file(file_path, 'wb' if isinstance(text, bytes) else 'w') as f:
+        f.write(text)
+
+
+def write_json_atomic(file_path, data):
+    """
+    writes data as json to a temporary file then renames it\n
+    params:
+        str file_path: destination path
+        data: json serializable data
+    """
+    write_file_atomic(file_path, json.dumps(data))
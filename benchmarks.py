@@ -0,0 +1,185 @@
+from chapter_store import open_store, zstandard
+from helper_functions import get_novel_path, clean_text, clean_filename
+from helper_functions import folder_size
+
+import os
+import re
+import sys
+import json
+import time
+import tempfile
+import argparse
+import multiprocessing
+
+
+def load_novel_texts(name):
+    """
+    reads a saved novel's chapters without touching the network
+    params:
+        str name: novel's name
+    return:
+        texts: list[str]
+    """
+    novel_path = get_novel_path(name)
+    with open(os.path.join(novel_path, 'novel_data.json')) as f:
+        data = json.load(f)
+        f.close()
+    with open(os.path.join(novel_path, 'chapters_manifest.json')) as f:
+        manifest = json.load(f)
+        f.close()
+
+    store = open_store(novel_path, data.get('storage', 'folder'),
+                       data.get('compression'))
+    texts = [store.read(entry['path']) for entry in manifest]
+    store.close()
+    return texts
+
+
+def bench_storage(texts):
+    """
+    compares on-disk size and read throughput of the storage options
+    params:
+        list texts: chapters contents
+    """
+    raw_size = sum(len(text.encode()) for text in texts)
+    configs = [('folder', None, False), ('folder', 'zlib', False),
+               ('folder', 'zlib', True), ('sqlite', None, False),
+               ('sqlite', 'zlib', True)]
+    if zstandard is not None:
+        configs += [('folder', 'zstd', False), ('folder', 'zstd', True),
+                    ('sqlite', 'zstd', True)]
+
+    print(f"{len(texts)} chapters, {raw_size / 2**20:.2f} MB of text")
+    print(f"{'storage':<8} {'compression':<12} {'dict':<5} "
+          f"{'size MB':>9} {'ratio':>6} {'read MB/s':>10}")
+    for storage, compression, use_dict in configs:
+        with tempfile.TemporaryDirectory() as folder:
+            store = open_store(folder, storage, compression)
+            if use_dict:
+                store.compressor.train(texts[:200])
+            paths = [os.path.join(folder, f"{n}.txt")
+                     for n in range(len(texts))]
+            for path, text in zip(paths, texts):
+                store.write(path, text)
+            # closing checkpoints sqlite's write-ahead log
+            store.close()
+            size = folder_size(folder)
+
+            store = open_store(folder, storage, compression)
+            start = time.perf_counter()
+            for path in paths:
+                store.read(path)
+            elapsed = time.perf_counter() - start
+            store.close()
+
+        print(f"{storage:<8} {str(compression):<12} {str(use_dict):<5} "
+              f"{size / 2**20:>9.2f} {size / raw_size:>6.2f} "
+              f"{raw_size / 2**20 / elapsed:>10.1f}")
+
+
+def peak_memory():
+    """
+    peak resident memory in MB of this process and of its largest
+    finished child process (None where resource isn't available)
+    return:
+        tuple: (self MB, children MB)
+    """
+    try:
+        import resource
+    except ImportError:
+        return None, None
+    # linux reports KB, macOS bytes
+    scale = 1024 if sys.platform != 'darwin' else 1024 * 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return own, children / scale
+
+
+def _run_export(name, export_format, results):
+    """ runs one export in a fresh process and reports time and memory """
+    from classes import Novel
+
+    novel = Novel(name, load=True)
+    novel.initialize()
+    start = time.perf_counter()
+    if export_format == 'epub':
+        novel.export_as_epub()
+    elif export_format == 'pdf':
+        novel.export_as_pdf()
+    elapsed = time.perf_counter() - start
+    results.put((elapsed,) + peak_memory())
+
+
+def bench_export(name):
+    """
+    compares epub and pdf export time and peak memory on the same novel,
+    each export runs in its own process so peaks don't mix
+    params:
+        str name: novel's name
+    """
+    print(f"{'format':<6} {'seconds':>9} {'peak MB':>9} {'worker MB':>10}")
+    for export_format in ('epub', 'pdf'):
+        results = multiprocessing.Queue()
+        process = multiprocessing.Process(
+            target=_run_export, args=(name, export_format, results))
+        process.start()
+        elapsed, own, children = results.get()
+        process.join()
+        own = f"{own:.1f}" if own is not None else "n/a"
+        children = f"{children:.1f}" if children is not None else "n/a"
+        print(f"{export_format:<6} {elapsed:>9.2f} {own:>9} {children:>10}")
+
+
+def legacy_clean_text(text):
+    """ clean_text before the single pass rewrite, kept to compare """
+    for char in ['\n', '\t', '\r']:
+        clean_text = text.replace(char, '')
+    clean_text = clean_text.strip()
+    for i in re.findall(r'".*"\b', clean_text):
+        clean_text = clean_text.replace(i, '"{}" '.format(i[1:-2].strip()))
+    return clean_text
+
+
+def bench_clean(texts, rounds=5):
+    """
+    measures the cleaning throughput on chapters text
+    params:
+        list texts: chapters contents
+        int rounds: passes over every chapter
+    """
+    size = sum(len(text.encode()) for text in texts) * rounds
+    print(f"{len(texts)} chapters, {size / rounds / 2**20:.2f} MB of text")
+
+    cleaners = [('clean_text', clean_text),
+                ('legacy clean_text', legacy_clean_text),
+                ('clean_filename', clean_filename)]
+    for label, cleaner in cleaners:
+        start = time.perf_counter()
+        for _ in range(rounds):
+            for text in texts:
+                cleaner(text)
+        elapsed = time.perf_counter() - start
+        print(f"{label:<18} {size / 2**20 / elapsed:>9.1f} MB/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Performance benchmarks")
+    parser.add_argument('benchmark', choices=['storage', 'export', 'clean'])
+    parser.add_argument('name', help="saved novel used as sample text")
+    args = parser.parse_args()
+
+    if args.benchmark == 'export':
+        bench_export(args.name)
+        return
+
+    texts = load_novel_texts(args.name)
+    if not texts:
+        sys.exit("Novel has no saved chapters")
+    if args.benchmark == 'storage':
+        bench_storage(texts)
+    elif args.benchmark == 'clean':
+        bench_clean(texts)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+from urllib.parse import urlparse
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+
+CATALOG_FILE = os.path.join(os.getcwd(), 'library.db')
+# catalog before it moved to sqlite, imported once
+LEGACY_LIST_FILE = os.path.join(os.getcwd(), 'novels_list.json')
+# seconds a writer waits for another process holding the database
+BUSY_TIMEOUT = 30
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+
+class Catalog():
+    """
+    Catalog Class - library of every saved novel in one sqlite file\n
+    each novel has its link, domain, chapters count, size on disk and
+    the time of its last update and export\n
+    params:
+        str db_path: catalog's file
+    """
+    FIELDS = ('name', 'link', 'domain', 'chapters', 'size', 'added_at',
+              'updated_at', 'exported_at')
+
+    def __init__(self, db_path=CATALOG_FILE):
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        # one connection shared by the workers, WAL lets other processes
+        # read while a batch is writing
+        self.connection = sqlite3.connect(db_path, timeout=BUSY_TIMEOUT,
+                                          check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS novels ("
+                "name TEXT PRIMARY KEY, link TEXT NOT NULL, "
+                "domain TEXT NOT NULL, chapters INTEGER DEFAULT 0, "
+                "size INTEGER DEFAULT 0, added_at REAL, "
+                "updated_at REAL, exported_at REAL)")
+            self.connection.execute(
+                "CREATE INDEX IF NOT EXISTS novels_domain "
+                "ON novels(domain)")
+        self.import_legacy_list()
+
+    def import_legacy_list(self, file_path=LEGACY_LIST_FILE):
+        """
+        imports novels_list.json if the catalog is still empty
+        params:
+            str file_path: novels list's path
+        """
+        if not os.path.isfile(file_path):
+            return
+        with open(file_path, 'r') as f:
+            novels_list = json.load(f)
+            f.close()
+        with self.lock, self.connection:
+            count = self.connection.execute(
+                "SELECT COUNT(*) FROM novels").fetchone()[0]
+            if count:
+                return
+            now = time.time()
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO novels (name, link, domain, added_at) "
+                "VALUES (?, ?, ?, ?)",
+                [(name, link, urlparse(link).netloc, now)
+                 for name, link in novels_list.items()])
+        logging.info("Imported %d novels into the catalog", len(novels_list))
+
+    def add(self, name, link):
+        """
+        adds a novel or changes its link
+        params:
+            str name: novel's name
+            str link: novel's link
+        """
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT INTO novels (name, link, domain, added_at) "
+                "VALUES (?, ?, ?, ?) ON CONFLICT(name) DO UPDATE SET "
+                "link = excluded.link, domain = excluded.domain",
+                (name, link, urlparse(link).netloc, time.time()))
+
+    def remove(self, name):
+        """ removes a novel from the catalog, its folder is kept """
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM novels WHERE name = ?",
+                                    (name,))
+
+    def record_update(self, name, chapters, size):
+        """
+        stores a novel's state after it got saved
+        params:
+            str name: novel's name
+            int chapters: number of chapters
+            int size: novel's folder size in bytes
+        """
+        with self.lock, self.connection:
+            self.connection.execute(
+                "UPDATE novels SET chapters = ?, size = ?, updated_at = ? "
+                "WHERE name = ?", (chapters, size, time.time(), name))
+
+    def record_export(self, name, size):
+        """
+        stores the time of a novel's last export
+        params:
+            str name: novel's name
+            int size: novel's folder size in bytes, exports included
+        """
+        with self.lock, self.connection:
+            self.connection.execute(
+                "UPDATE novels SET size = ?, exported_at = ? "
+                "WHERE name = ?", (size, time.time(), name))
+
+    def get(self, name):
+        """
+        gets a novel's entry
+        params:
+            str name: novel's name
+        return:
+            entry: dict{name, link, domain, chapters, size, added_at,
+                        updated_at, exported_at} (None if not found)
+        """
+        with self.lock:
+            row = self.connection.execute(
+                f"SELECT {', '.join(self.FIELDS)} FROM novels "
+                "WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            return None
+        return dict(zip(self.FIELDS, row))
+
+    def links(self, domain=None):
+        """
+        gets the novels' links sorted by name
+        params:
+            str domain: only novels of this domain if provided
+        return:
+            novels_list: dict{name: str link}
+        """
+        query = "SELECT name, link FROM novels"
+        params = ()
+        if domain is not None:
+            query += " WHERE domain = ?"
+            params = (domain,)
+        with self.lock:
+            rows = self.connection.execute(query + " ORDER BY name",
+                                           params).fetchall()
+        return dict(rows)
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+def get_catalog():
+    """
+    gets the catalog shared by the whole process
+    return:
+        catalog: Catalog
+    """
+    global _catalog
+    with _catalog_lock:
+        if _catalog is None:
+            _catalog = Catalog()
+        return _catalog
@@ -0,0 +1,506 @@
+from atomic_write import write_file_atomic
+from metrics import metrics
+
+from collections import Counter, OrderedDict
+import os
+import hashlib
+import sqlite3
+import threading
+import zlib
+
+# zstandard is optional, zlib is used without it
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+STORAGE_BACKENDS = ('folder', 'sqlite')
+COMPRESSION_METHODS = ('zlib', 'zstd')
+
+# compressed chapters files get this suffix in the folder store
+COMPRESSED_SUFFIX = '.z'
+# chapters needed before training a novel's dictionary
+DICT_MIN_SAMPLES = 20
+# chapters used to train a dictionary
+DICT_MAX_SAMPLES = 200
+# zlib only uses the last 32KB of a dictionary
+ZLIB_DICT_SIZE = 32 * 1024
+ZSTD_DICT_SIZE = 110 * 1024
+ZSTD_LEVEL = 10
+
+# max characters of chapters content kept in memory
+CONTENT_CACHE_SIZE = 32 * 1024 * 1024
+
+
+class ContentCache():
+    """
+    ContentCache Class - size bounded LRU of chapters content\n
+    params:
+        int max_size: max characters kept
+    """
+    def __init__(self, max_size=CONTENT_CACHE_SIZE):
+        self.max_size = max_size
+        self.size = 0
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, path):
+        """
+        gets a chapter's content if it's cached
+        params:
+            str path: chapter's path
+        return:
+            content: str (None if not cached)
+        """
+        with self.lock:
+            content = self.items.get(path)
+            if content is not None:
+                self.items.move_to_end(path)
+        if content is None:
+            metrics.count('cache_misses', cache='content')
+        else:
+            metrics.count('cache_hits', cache='content')
+        return content
+
+    def put(self, path, content):
+        """
+        caches a chapter's content, dropping the least recently used ones
+        params:
+            str path: chapter's path
+            str content: chapter's content
+        """
+        with self.lock:
+            if path in self.items:
+                self.size -= len(self.items.pop(path))
+            if len(content) > self.max_size:
+                return
+            self.items[path] = content
+            self.size += len(content)
+            while self.size > self.max_size:
+                _, dropped = self.items.popitem(last=False)
+                self.size -= len(dropped)
+
+    def clear(self):
+        with self.lock:
+            self.items.clear()
+            self.size = 0
+
+
+# shared by all chapters
+content_cache = ContentCache()
+
+
+class Compressor():
+    """
+    Compressor Class - compresses chapters with a dictionary trained on
+    the novel's own chapters, they share names and boilerplate\n
+    every compressed chapter starts with one byte telling how to read it,
+    zlib and zstd data also tell which dictionary they need so chapters
+    can be read while a migration replaces the dictionary\n
+    params:
+        str novel_path: novel's folder
+        str method: 'zlib' or 'zstd' (zlib if zstandard isn't installed)
+    """
+    FILE_NAME = 'dictionary.bin'
+    # dictionaries trained by a migration, kept until it's saved
+    PENDING_PREFIX = 'dictionary-'
+    # headers: method and if the dictionary was used
+    ZLIB, ZLIB_DICT, ZSTD, ZSTD_DICT = b'z', b'Z', b's', b'S'
+
+    def __init__(self, novel_path, method='zlib'):
+        assert(method in COMPRESSION_METHODS)
+        if method == 'zstd' and zstandard is None:
+            method = 'zlib'
+        self.method = method
+        self.novel_path = novel_path
+        self.dict_path = os.path.join(novel_path, self.FILE_NAME)
+        self.dictionary = None
+        # {(method, dictionary id): dictionary} of every saved dictionary
+        self.dictionaries = {}
+        if os.path.isdir(novel_path):
+            for file_name in sorted(os.listdir(novel_path)):
+                if self.is_dictionary_file(file_name):
+                    with open(os.path.join(novel_path, file_name),
+                              'rb') as f:
+                        self.add_dictionary(f.read())
+                        f.close()
+        if os.path.isfile(self.dict_path):
+            with open(self.dict_path, 'rb') as f:
+                self.dictionary = f.read()
+                f.close()
+
+    def is_dictionary_file(self, file_name):
+        return file_name == self.FILE_NAME or (
+            file_name.startswith(self.PENDING_PREFIX) and
+            file_name.endswith('.bin'))
+
+    def add_dictionary(self, dictionary):
+        """ makes a dictionary usable to read chapters """
+        self.dictionaries[('zlib', zlib.adler32(dictionary))] = dictionary
+        if zstandard is not None:
+            dict_id = zstandard.ZstdCompressionDict(dictionary).dict_id()
+            self.dictionaries[('zstd', dict_id)] = dictionary
+
+    def find_dictionary(self, method, dict_id):
+        dictionary = self.dictionaries.get((method, dict_id))
+        if dictionary is None:
+            raise ValueError("Chapter needs a missing dictionary")
+        return dictionary
+
+    def train(self, samples, pending=False):
+        """
+        builds and saves the novel's dictionary
+        params:
+            list samples: chapters contents
+            bool pending: keep the current dictionary file until commit
+        """
+        if self.method == 'zstd':
+            encoded = [sample.encode() for sample in samples]
+            dictionary = zstandard.train_dictionary(ZSTD_DICT_SIZE, encoded)
+            self.dictionary = dictionary.as_bytes()
+        else:
+            self.dictionary = zlib_dictionary(samples)
+        dict_path = self.dict_path
+        if pending:
+            # named by content so it never replaces a dictionary in use
+            digest = hashlib.sha256(self.dictionary).hexdigest()[:16]
+            dict_path = os.path.join(self.novel_path,
+                                     f"{self.PENDING_PREFIX}{digest}.bin")
+        write_file_atomic(dict_path, self.dictionary)
+        self.add_dictionary(self.dictionary)
+
+    def commit(self):
+        """
+        makes the current dictionary the novel's dictionary once every
+        chapter was written with it, older dictionaries are removed
+        """
+        if self.dictionary is None:
+            if os.path.isfile(self.dict_path):
+                os.remove(self.dict_path)
+        else:
+            write_file_atomic(self.dict_path, self.dictionary)
+        for file_name in os.listdir(self.novel_path):
+            if (file_name != self.FILE_NAME and
+               self.is_dictionary_file(file_name)):
+                os.remove(os.path.join(self.novel_path, file_name))
+
+    def compress(self, content):
+        """
+        compresses a chapter's content
+        params:
+            str content
+        return:
+            data: bytes
+        """
+        data = content.encode()
+        if self.method == 'zstd':
+            if self.dictionary is None:
+                compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL)
+                return self.ZSTD + compressor.compress(data)
+            dict_data = zstandard.ZstdCompressionDict(self.dictionary)
+            compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL,
+                                                  dict_data=dict_data)
+            return self.ZSTD_DICT + compressor.compress(data)
+
+        if self.dictionary is None:
+            return self.ZLIB + zlib.compress(data, 9)
+        compressor = zlib.compressobj(9, zdict=self.dictionary)
+        return self.ZLIB_DICT + compressor.compress(data) + compressor.flush()
+
+    def decompress(self, data):
+        """
+        decompresses a chapter's content
+        params:
+            bytes data
+        return:
+            content: str
+        """
+        header, data = data[:1], data[1:]
+        if header == self.ZLIB:
+            return zlib.decompress(data).decode()
+        elif header == self.ZLIB_DICT:
+            # zlib streams carry their dictionary's adler32 after 2 bytes
+            dictionary = self.find_dictionary(
+                'zlib', int.from_bytes(data[2:6], 'big'))
+            decompressor = zlib.decompressobj(zdict=dictionary)
+            return (decompressor.decompress(data) +
+                    decompressor.flush()).decode()
+        elif header in (self.ZSTD, self.ZSTD_DICT):
+            if zstandard is None:
+                raise RuntimeError("zstandard is needed to read this chapter")
+            dict_data = None
+            if header == self.ZSTD_DICT:
+                dict_id = zstandard.get_frame_parameters(data).dict_id
+                dict_data = zstandard.ZstdCompressionDict(
+                    self.find_dictionary('zstd', dict_id))
+            decompressor = zstandard.ZstdDecompressor(dict_data=dict_data)
+            return decompressor.decompress(data).decode()
+        raise ValueError("Unknown chapter compression")
+
+
+def zlib_dictionary(samples):
+    """
+    builds a zlib dictionary from lines repeated across chapters\n
+    most common lines go last since zlib prefers close matches
+    params:
+        list samples: chapters contents
+    return:
+        dictionary: bytes
+    """
+    counter = Counter()
+    for sample in samples:
+        counter.update(set(sample.split('\n')))
+    repeated = [line for line, count in counter.most_common()
+                if count > 1 and line.strip()]
+
+    dictionary = b''
+    for line in repeated:
+        encoded = line.encode() + b'\n'
+        if len(dictionary) + len(encoded) > ZLIB_DICT_SIZE:
+            break
+        dictionary = encoded + dictionary
+    # fill the rest with plain text from the chapters
+    for sample in samples:
+        if len(dictionary) >= ZLIB_DICT_SIZE:
+            break
+        room = ZLIB_DICT_SIZE - len(dictionary)
+        dictionary = sample.encode()[:room] + dictionary
+    return dictionary
+
+
+class FolderStore():
+    """
+    FolderStore Class - stores each chapter as a txt file in novel's folder\n
+    compressed chapters get COMPRESSED_SUFFIX added to their path\n
+    params:
+        str novel_path: novel's folder
+        Compressor compressor: compresses chapters if provided
+    """
+    def __init__(self, novel_path, compressor=None):
+        self.novel_path = novel_path
+        self.compressor = compressor
+
+    def file_path(self, path):
+        if self.compressor is None:
+            return path
+        return path + COMPRESSED_SUFFIX
+
+    def read(self, path):
+        """
+        reads a chapter's content
+        params:
+            str path: chapter's path
+        return:
+            content: str
+        """
+        if self.compressor is not None:
+            with open(self.file_path(path), 'rb') as f:
+                data = f.read()
+                f.close()
+            return self.compressor.decompress(data)
+
+        with open(path, 'r') as f:
+            content = f.read()
+            f.close()
+        return content
+
+    def write(self, path, content, number=None):
+        """
+        writes a chapter's content if it changed
+        params:
+            str path: chapter's path
+            str content: chapter's content
+            int number: chapter's number, unused by this store
+        """
+        if self.compressor is not None:
+            write_file_atomic(self.file_path(path),
+                              self.compressor.compress(content))
+            return
+
+        if os.path.isfile(path):
+            with open(path) as f:
+                same_content = f.read() == content
+                f.close()
+            if same_content:
+                return
+        write_file_atomic(path, content)
+
+    def set_numbers(self, paths):
+        """ numbers are the chapters order in the manifest, nothing to do """
+        pass
+
+    def exists(self, path):
+        """ checks if a chapter is stored """
+        return os.path.isfile(self.file_path(path))
+
+    def remove(self, path):
+        """ removes a stored chapter """
+        if os.path.isfile(self.file_path(path)):
+            os.remove(self.file_path(path))
+
+    def close(self):
+        pass
+
+
+class SQLiteStore():
+    """
+    SQLiteStore Class - packs all chapters in one sqlite file\n
+    chapters are keyed by their file name and indexed by their number\n
+    params:
+        str novel_path: novel's folder
+        Compressor compressor: compresses chapters if provided
+    """
+    FILE_NAME = 'chapters.db'
+
+    def __init__(self, novel_path, compressor=None):
+        self.novel_path = novel_path
+        self.compressor = compressor
+        self.db_path = os.path.join(novel_path, self.FILE_NAME)
+        self.lock = threading.Lock()
+        # one connection shared by the download threads
+        self.connection = sqlite3.connect(self.db_path,
+                                          check_same_thread=False)
+        with self.lock:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS chapters ("
+                "key TEXT PRIMARY KEY, number INTEGER, content TEXT)")
+            self.connection.execute(
+                "CREATE INDEX IF NOT EXISTS chapters_number "
+                "ON chapters(number)")
+            self.connection.commit()
+
+    @staticmethod
+    def key(path):
+        # only the file name so the novel's folder can be moved
+        return os.path.basename(path)
+
+    def read(self, path):
+        """
+        reads a chapter's content
+        params:
+            str path: chapter's path
+        return:
+            content: str
+        """
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT content FROM chapters WHERE key = ?",
+                (self.key(path),)).fetchone()
+        if row is None:
+            raise FileNotFoundError(path)
+        return self.decode(row[0])
+
+    def read_number(self, number):
+        """
+        reads a chapter's content by its number
+        params:
+            int number: chapter's number, starting from 1
+        return:
+            content: str
+        """
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT content FROM chapters WHERE number = ?",
+                (number,)).fetchone()
+        if row is None:
+            raise KeyError(number)
+        return self.decode(row[0])
+
+    def decode(self, data):
+        # rows written before compression was enabled are plain text
+        if isinstance(data, bytes):
+            return self.compressor.decompress(data)
+        return data
+
+    def write(self, path, content, number=None):
+        """
+        writes a chapter's content
+        params:
+            str path: chapter's path
+            str content: chapter's content
+            int number: chapter's number, kept if not provided
+        """
+        if self.compressor is not None:
+            content = self.compressor.compress(content)
+        with self.lock:
+            self.connection.execute(
+                "INSERT INTO chapters (key, number, content) "
+                "VALUES (?, ?, ?) ON CONFLICT(key) DO UPDATE SET "
+                "content = excluded.content, "
+                "number = COALESCE(excluded.number, chapters.number)",
+                (self.key(path), number, content))
+            self.connection.commit()
+
+    def set_numbers(self, paths):
+        """
+        numbers chapters by their order
+        params:
+            list paths: chapters paths in reading order
+        """
+        rows = [(number, self.key(path))
+                for number, path in enumerate(paths, 1)]
+        with self.lock:
+            self.connection.executemany(
+                "UPDATE chapters SET number = ? WHERE key = ?", rows)
+            self.connection.commit()
+
+    def exists(self, path):
+        """ checks if a chapter is stored """
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT 1 FROM chapters WHERE key = ?",
+                (self.key(path),)).fetchone()
+        return row is not None
+
+    def remove(self, path):
+        """ removes a stored chapter """
+        with self.lock:
+            self.connection.execute("DELETE FROM chapters WHERE key = ?",
+                                    (self.key(path),))
+            self.connection.commit()
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+def open_store(novel_path, storage='folder', compression=None):
+    """
+    opens the chapters store of a novel
+    params:
+        str novel_path: novel's folder
+        str storage: 'folder' or 'sqlite'
+        str compression: None, 'zlib' or 'zstd'
+    return:
+        store: FolderStore or SQLiteStore
+    """
+    compressor = None
+    if compression is not None:
+        compressor = Compressor(novel_path, compression)
+    if storage == 'sqlite':
+        return SQLiteStore(novel_path, compressor)
+    elif storage == 'folder':
+        return FolderStore(novel_path, compressor)
+    raise ValueError(f"Unknown storage backend: {storage}")
+
+
+def main():
+    """ migrates a saved novel to another storage backend """
+    import argparse
+    from classes import Novel
+
+    parser = argparse.ArgumentParser(
+        description="Move a novel's chapters to another storage backend")
+    parser.add_argument('name', help="novel's name")
+    parser.add_argument('storage', choices=STORAGE_BACKENDS)
+    parser.add_argument('--compression', choices=COMPRESSION_METHODS)
+    args = parser.parse_args()
+
+    novel = Novel(args.name, load=True)
+    novel.initialize()
+    novel.migrate_storage(args.storage, args.compression)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,85 @@
 from helper_functions import *
+from network import configure_session, save_validators
+from network import get_session, fetch
+from chapter_store import open_store, content_cache
+from chapter_store import STORAGE_BACKENDS, COMPRESSION_METHODS
+from chapter_store import DICT_MIN_SAMPLES, DICT_MAX_SAMPLES
+from parsers import get_parser, parse_page, select
+from catalog import get_catalog
+from metrics import metrics
+from atomic_write import atomic_file, atomic_path, temp_path, commit_temp
+from atomic_write import write_file_atomic, write_json_atomic
 
 import novel_exceptions
 
 import cfscrape
 import jinja2
-from bs4 import BeautifulSoup
 
 import os
 import json
 import logging
 import logging.config
-from shutil import copy, copytree, rmtree
-
-from weasyprint import HTML, CSS
+import threading
+import itertools
+import hashlib
+import mimetypes
+import time
+import uuid
+import zipfile
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures import wait, FIRST_COMPLETED
+
+from pdf_export import render_part, merge_parts, pdf_template_version
+from pdf_export import PdfWriter
 
 logging.config.fileConfig(fname='log.conf')
 logger = logging.getLogger(__name__)
 
+# number of chapters downloaded at the same time
+DEFAULT_WORKERS = 8
+# rendered template pieces written to an export file at once
+EXPORT_BUFFER_CHUNKS = 64
+# chapters laid out by a pdf worker process at once
+PDF_RANGE_SIZE = 100
+# index pages crawled at most when the last page isn't known
+TOC_MAX_PAGES = 1000
+# statuses of pages past the end of an index whose last page isn't known
+TOC_END_STATUSES = (404, 410)
+
+# files from the templates folder used by html exports
+EXPORT_ASSETS = ('style.css', 'scripts', 'fonts')
+
+_template_env = None
+_template_env_lock = threading.Lock()
+_assets_lock = threading.Lock()
+
+
+def get_template(template_name):
+    """
+    loads a compiled template, the environment is shared by the whole
+    process and compiled templates are cached on disk between runs
+    params:
+        str template_name
+    return:
+        template: jinja2.Template
+    """
+    global _template_env
+    with _template_env_lock:
+        if _template_env is None:
+            templates_folder = os.path.join(os.getcwd(), 'templates')
+            bytecode_folder = os.path.join(os.getcwd(), 'Cache', 'jinja')
+            if not os.path.exists(bytecode_folder):
+                os.makedirs(bytecode_folder)
+            # set jinja2 enviroment
+            template_loader = jinja2.FileSystemLoader(
+                searchpath=templates_folder)
+            _template_env = jinja2.Environment(
+                loader=template_loader, autoescape=True,
+                bytecode_cache=jinja2.FileSystemBytecodeCache(
+                    bytecode_folder))
+    return _template_env.get_template(template_name)
+
 
 class Novel():
     """
@@ -27,6 +90,13 @@ class Novel():
             str link: link to novel
             bool load: load novel from local folder or not
             (always True if link not provided)
+            int workers: number of chapters fetched at the same time
+            int host_limit: max concurrent requests to the same host
+            bool resume: reuse chapters saved by an interrupted run
+            str storage: chapters storage for new novels,
+            'folder' (txt files) or 'sqlite' (one packed file)
+            str compression: chapters compression for new novels,
+            None, 'zlib' or 'zstd'
     """
     def __init__(self, name, **kwrgs):
         # main variables
@@ -35,6 +105,11 @@ class Novel():
                                  clean_foldername(self.name))
         self.exportsPath = os.path.join(self.path, 'Exports')
         self.initialized = False
+        # ETag/Last-Modified of the novel page from the last fetch
+        self.index_validators = None
+        # remote chapters [(title, link)] in reading order
+        self.chapters_list = []
+        self.chapters = []
 
         self.link = None
         # get link if in kwrgs
@@ -48,12 +123,47 @@ class Novel():
         elif 'load' in list(kwrgs.keys()):
             self.load = kwrgs['load']
 
-        if self.name not in load_novels_list().keys():
+        # download concurrency
+        self.workers = DEFAULT_WORKERS
+        if 'workers' in list(kwrgs.keys()):
+            self.workers = max(1, kwrgs['workers'])
+        self.host_limit = HOST_CONCURRENCY
+        if 'host_limit' in list(kwrgs.keys()):
+            self.host_limit = max(1, kwrgs['host_limit'])
+
+        # chapters are journaled as they land so a crash can be resumed
+        self.journalPath = os.path.join(self.path, 'chapters_journal.jsonl')
+        self.journal_lock = threading.Lock()
+        self.resume = True
+        if 'resume' in list(kwrgs.keys()):
+            self.resume = kwrgs['resume']
+
+        # chapters storage backend, saved novels keep their own
+        self.storage = 'folder'
+        if 'storage' in list(kwrgs.keys()):
+            assert(kwrgs['storage'] in STORAGE_BACKENDS)
+            self.storage = kwrgs['storage']
+        self.compression = None
+        if 'compression' in list(kwrgs.keys()):
+            assert(kwrgs['compression'] in COMPRESSION_METHODS)
+            self.compression = kwrgs['compression']
+        self._store = None
+
+        # loaded novels are already in the catalog
+        if self.link is not None and get_catalog().get(self.name) is None:
             add_to_novels_list(self.name, self.link)
 
     def __repr__(self):
         return self.name
 
+    @property
+    def store(self):
+        """ chapters store, opened on first use """
+        if self._store is None:
+            self._store = open_store(self.path, self.storage,
+                                     self.compression)
+        return self._store
+
     def initialize(self, debug=False) -> None:
         """ initializes novel object """
         # Create novel folder if it doesn't exist
@@ -75,6 +185,8 @@ class Novel():
 
                 self.site_domain = self.data['domain']
                 self.cf = self.data['cf']
+                self.storage = self.data.get('storage', 'folder')
+                self.compression = self.data.get('compression')
 
                 self.initialized = True
                 logging.info("Loading Chapters Data")
@@ -97,62 +209,86 @@ class Novel():
         logging.info("Fetching Novel Host Data")
         self.site_domain = get_site_domain(self.link)
         self.site_data = load_site_data(self.site_domain)
+        self.parser = get_parser(self.site_data)
         self.cf = True if self.site_data['cloudflare'] == "1" else False
-        self.scraper = cfscrape.create_scraper() if self.cf else None
+        self.scraper = None
+        if self.cf:
+            self.scraper = configure_session(cfscrape.create_scraper(),
+                                             self.host_limit)
+        else:
+            # the shared session's pools have to fit this novel's limit
+            get_session(self.host_limit)
 
         self.initialized = True
 
         if self.load is False:
-            logging.info("Fetching Chapters Data")
-            self.data, self.chapters_data = self.get_novel_data()
-            logging.info("Fetching Chapters")
-            self.chapters = self.get_chapters(5 if debug else 0)
+            with metrics.novel(self.name):
+                logging.info("Fetching Chapters Data")
+                self.data, self.chapters_data = self.get_novel_data()
+                logging.info("Fetching Chapters")
+                self.chapters = self.get_chapters(5 if debug else 0)
 
     # fetching methods
 
-    def get_chapter_data(self, chapters_elements=[]):
+    def get_chapters_list(self, chapters_elements=None):
         """
-            gets chapters data
+            gets chapters titles and links in reading order
             params:
                 list chapter_elements: list of chapters html tags
                 if not provided it gets them
-                    default: [empty list]
+                    default: None
             return:
-                chapters_data : dict{
-                    chapter title: chapter link\n
-                    }
+                chapters_list : list[(chapter title, chapter link)]
         """
 
-        # checks if chapters html tags are provided
-        if chapters_elements is []:
+        # checks if chapters html tags are provided, an empty list is a
+        # page without chapters
+        if chapters_elements is None:
             # if not it gets them
             if self.cf:
                 html = load_cfpage(self.link, self.scraper)
             else:
                 html = load_page(self.link)
-            bs4 = BeautifulSoup(html, "html.parser")
             chapters_data_selector = self.site_data['chapter_data_selector']
-            chapters_elements = bs4.select(chapters_data_selector)
+            chapters_elements = select(html, chapters_data_selector,
+                                       self.parser)
 
         # get chapters data
-        chapters_data = {}
+        chapters_list = []
         for chapter_element in chapters_elements:
             title = clean_up_title(chapter_element.get_text())
-
             # some url are relative
-            if is_absloute_url(chapter_element['href']):
-                chapter_link = chapter_element['href']
-            else:
-                chapter_link = realtive_to_absloute(chapter_element['href'],
-                                                    self.site_domain)
+            chapter_link = self.element_link(chapter_element)
+            chapters_list.append((title, chapter_link))
 
-            # set the title as a key in the dict with the url as value
-            chapters_data[title] = chapter_link
-        return chapters_data
+        # reverse chapters sorting if needed
+        if self.site_data['reverse'] == "1":
+            chapters_list.reverse()
+        return chapters_list
 
-    def get_novel_data(self):
+    def get_chapter_data(self, chapters_elements=None):
+        """
+            gets chapters data
+            params:
+                list chapter_elements: list of chapters html tags
+                if not provided it gets them
+                    default: None
+            return:
+                chapters_data : dict{
+                    chapter title: chapter link\n
+                    }
+        """
+        chapters_list = self.get_chapters_list(chapters_elements)
+        # keep the site's ordering in the dict
+        if self.site_data['reverse'] == "1":
+            chapters_list = list(reversed(chapters_list))
+        return dict(chapters_list)
+
+    def get_novel_data(self, conditional=False):
         """
         gets novel's data\n
+        params:
+            bool conditional: only if the page changed since the last save
         return:\n
             tuple:
                 novel_data: dict{\n
@@ -163,19 +299,26 @@ class Novel():
                     title: str\n
                     link: str\n
                     }
+            (None, None) if conditional and the page wasn't modified
         """
-        # get novel page html content
-        if self.cf:
-            html = load_cfpage(self.link, self.scraper)
-        else:
-            html = load_page(self.link)
+        # get novel page html content and its validators
+        html, self.index_validators = load_page_if_modified(
+            self.link, self.scraper, conditional)
+        if self.index_validators is None:
+            return None, None
 
         # parse html content
-        bs4 = BeautifulSoup(html, "html.parser")
+        bs4 = parse_page(html, self.parser)
         cover_element = bs4.select(self.site_data['cover_selector'])[0]
         desc_element = bs4.select(self.site_data['desc_selector'])[0]
         chapters_elements = bs4.select(self.site_data['chapter_data_selector'])
 
+        # table of contents split over several pages
+        partial_index = False
+        if self.site_data.get('toc_page_link'):
+            chapters_elements, partial_index = self.crawl_index(
+                bs4, chapters_elements)
+
         # get cover image link
         cover_link = ""
         if is_absloute_url(cover_element['src']):
@@ -187,15 +330,150 @@ class Novel():
         # get description
         description = clean_text(desc_element.get_text())
 
-        chapters_data = self.get_chapter_data(chapters_elements)
+        # chapters in reading order, duplicate titles included
+        self.chapters_list = self.get_chapters_list(chapters_elements)
+        if partial_index:
+            self.chapters_list = self.merge_partial_index(self.chapters_list)
+        chapters_data = dict(self.chapters_list)
+        if self.site_data['reverse'] == "1":
+            chapters_data = dict(reversed(self.chapters_list))
 
         novel_data = {"name": self.name, "link": self.link,
                       "cover_link": cover_link,
                       "description": description,
                       "cf": self.cf, "domain": self.site_domain,
+                      "storage": self.storage,
+                      "compression": self.compression,
                       }
         return novel_data, chapters_data
 
+    def crawl_index(self, landing_page, landing_elements):
+        """
+        gets chapters html tags from every page of a paginated table of
+        contents, pages are fetched concurrently\n
+        site_data keys:
+            toc_page_link: page link format, e.g. "{link}?page={page}"
+            toc_first_page: number of the landing page (default 1)
+            toc_last_page_selector: element with the last page number
+            in its text or link (optional)
+        when pages can be crawled from the newest chapters to the oldest
+        crawling stops at the first page where every chapter is already
+        saved, otherwise every page is crawled\n
+        params:
+            BeautifulSoup landing_page: parsed novel page
+            list landing_elements: chapters html tags of the landing page
+        return:
+            tuple:
+                chapters_elements: list, in the site's order
+                partial: bool, True if crawling stopped early
+        """
+        first_page = int(self.site_data.get('toc_first_page', 1))
+        last_page = None
+        last_page_selector = self.site_data.get('toc_last_page_selector')
+        if last_page_selector:
+            last_page = get_page_number(
+                landing_page.select(last_page_selector))
+
+        # newest chapters are at the start of the index for reversed sites
+        newest_first = self.site_data['reverse'] == "1"
+        if last_page is None:
+            # pages are discovered until one has no chapters, is missing
+            # or repeats the previous one, some sites serve the last page
+            # again
+            pages = iter(range(first_page + 1, first_page + TOC_MAX_PAGES))
+        elif newest_first:
+            pages = iter(range(first_page + 1, last_page + 1))
+        else:
+            pages = iter(range(last_page, first_page, -1))
+        # new chapters of oldest first sites are on the last pages, which
+        # are only reached first when the last page is known
+        stop_early = newest_first or last_page is not None
+
+        known_links = set(canonical_url(chapter.link)
+                          for chapter in self.chapters)
+        chapters_selector = self.site_data['chapter_data_selector']
+
+        def fetch(page):
+            link = self.site_data['toc_page_link'].format(
+                link=self.link.rstrip('/'), page=page)
+            with metrics.novel(self.name), \
+                    get_host_semaphore(get_site_domain(link),
+                                       self.host_limit):
+                logging.info("Fetching Index Page: %d", page)
+                try:
+                    if self.cf:
+                        html = load_cfpage(link, self.scraper)
+                    else:
+                        html = load_page(link)
+                except novel_exceptions.PageLoadError as e:
+                    # only pages known to exist have to load
+                    if last_page is None and e.status in TOC_END_STATUSES:
+                        logging.info("Index ends before page %d", page)
+                        return []
+                    raise
+            return select(html, chapters_selector, self.parser)
+
+        def is_known(elements):
+            return all(canonical_url(self.element_link(element)) in
+                       known_links for element in elements)
+
+        def page_links(elements):
+            return tuple(self.element_link(element) for element in elements)
+
+        pages_elements = {first_page: landing_elements}
+        seen_pages = set([page_links(landing_elements)])
+        partial = False
+        done = False
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            while not done:
+                batch = list(itertools.islice(pages, self.workers))
+                if not batch:
+                    break
+                # map keeps the batch in crawl order
+                for page, elements in zip(batch, executor.map(fetch, batch)):
+                    links = page_links(elements)
+                    if not elements or links in seen_pages:
+                        done = True
+                        break
+                    seen_pages.add(links)
+                    pages_elements[page] = elements
+                    if stop_early and known_links and is_known(elements):
+                        partial = done = True
+                        break
+
+        # merge pages in the site's order
+        chapters_elements = []
+        for page in sorted(pages_elements):
+            chapters_elements.extend(pages_elements[page])
+        return chapters_elements, partial
+
+    def merge_partial_index(self, chapters_list):
+        """
+        completes a partially crawled chapters list with saved chapters\n
+        params:
+            list chapters_list: [(title, link)] of the crawled pages
+        return:
+            chapters_list: [(title, link)] saved chapters then new ones
+        """
+        crawled = {}
+        for chapter_title, chapter_link in chapters_list:
+            crawled[canonical_url(chapter_link)] = chapter_title
+
+        merged = []
+        for chapter in self.chapters:
+            key = canonical_url(chapter.link)
+            merged.append((crawled.pop(key, chapter.title), chapter.link))
+        for chapter_title, chapter_link in chapters_list:
+            if canonical_url(chapter_link) in crawled:
+                merged.append((chapter_title, chapter_link))
+        return merged
+
+    def element_link(self, chapter_element):
+        """ gets the absloute link of a chapter html tag """
+        if is_absloute_url(chapter_element['href']):
+            return chapter_element['href']
+        return realtive_to_absloute(chapter_element['href'], self.site_domain)
+
     def get_chapters(self, num=0):
         """
         creates a list of chapter objects\n
@@ -209,69 +487,158 @@ class Novel():
         # make sure novel object initialized
         assert(self.initialized is True)
 
+        chapters_list = self.chapters_list
+        if num > 0:
+            chapters_list = chapters_list[0:num]
+
+        # chapters already saved by an interrupted run
+        done = {}
+        if self.resume:
+            for entry in self.read_journal():
+                done[canonical_url(entry['link'])] = entry
+            if done:
+                logging.info("Resuming, %d chapters already saved", len(done))
+
+        missing = []
+        for chapter_title, chapter_link in chapters_list:
+            if canonical_url(chapter_link) not in done:
+                missing.append((chapter_title, chapter_link))
+        used_paths = set(entry['path'] for entry in done.values())
+        fetched = iter(self.fetch_chapters(missing, used_paths))
+
+        # merge saved and fetched chapters keeping the reading order
+        chapters = []
+        for chapter_title, chapter_link in chapters_list:
+            entry = done.get(canonical_url(chapter_link))
+            if entry is None:
+                chapters.append(next(fetched))
+            else:
+                chapters.append(self.load_chapter(entry))
+        return chapters
+
+    def fetch_chapters(self, chapters_list, used_paths=None):
+        """
+        fetches and saves chapters concurrently\n
+        params:
+            list chapters_list: [(title, link)] of the chapters to fetch
+            set used_paths: paths already taken by other chapters
+        return:
+            list chapters: [class Chapter] in the same order as the list
+        """
         text_selector = self.site_data["chapter_selector"]
-        # create chapter object for each chapter
+
+        # give chapters with the same title different files
+        used_paths = set() if used_paths is None else used_paths
         chapters = []
-        chapters_titles = list(self.chapters_data.keys())
-        if self.site_data['reverse'] == "1":
-            chapters_titles = list(reversed(chapters_titles))
-
-        n = 1
-        for chapter_title in chapters_titles[0:num-1]:
-            # create chapter object
-            chapter = Chapter(self, chapter_title,
-                              self.chapters_data[chapter_title], self.cf)
-            # fetch chapter content
-            logging.info("Fetching Chapter: %s", chapter_title)
-            chapter.content = chapter.get_content(text_selector, self.scraper)
-            logging.info("Saving Chapter: %s", chapter_title)
-            chapter.save()
-            # add to chapters list
-            chapters.append(chapter)
-            n += 1
+        for chapter_title, chapter_link in chapters_list:
+            path = unique_path(os.path.join(self.path,
+                                            clean_filename(chapter_title)),
+                               used_paths)
+            used_paths.add(path)
+            chapters.append(Chapter(self, chapter_title, chapter_link,
+                                    self.cf, path=path))
+
+        def fetch(chapter):
+            # fetch chapter content, limiting requests per host
+            host = get_site_domain(chapter.link)
+            with metrics.novel(self.name), \
+                    get_host_semaphore(host, self.host_limit):
+                logging.info("Fetching Chapter: %s", chapter.title)
+                chapter.content = chapter.get_content(text_selector,
+                                                      self.scraper)
+            logging.info("Saving Chapter: %s", chapter.title)
+            with metrics.timer('save', self.name):
+                chapter.save()
+                self.journal_chapter(chapter)
+            return chapter
+
+        # map returns results in the order of the list
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            chapters = list(executor.map(fetch, chapters))
         return chapters
 
     def update(self):
+        """
+        fetches chapters added to the site since the last save\n
+        return:
+            changed: bool, False if there is nothing to save
+        """
         # make sure novel object initialized
         assert(self.initialized is True)
 
-        text_selector = self.site_data["chapter_selector"]
-        # update chapters data
-        self.data, self.chapters_data = self.get_novel_data()
-
-        new_chapters = []
-        existing_chapters_titles = []
+        with metrics.timer('update', self.name), metrics.novel(self.name):
+            return self.update_chapters()
+
+    def update_chapters(self):
+        """ update's work, returns if anything changed """
+        # update chapters data, skipping everything if the page didn't change
+        # new chapters of a paginated index can leave the landing page as is
+        conditional = not self.site_data.get('toc_page_link')
+        novel_data, chapters_data = self.get_novel_data(conditional)
+        if novel_data is None:
+            logging.info("Novel page not modified, no new chapters")
+            return False
+        changed = (novel_data != self.data or
+                   chapters_data != self.chapters_data)
+        self.data, self.chapters_data = novel_data, chapters_data
 
         logging.info("Checking existing chapters")
-        # save existing chapters and get their titles
+        # existing chapters keyed by their canonical link
+        manifest = {}
         for chapter in self.chapters:
-            existing_chapters_titles.append(chapter.title)
-            new_chapters.append(chapter)
+            manifest[canonical_url(chapter.link)] = chapter
 
-        # reverse chapters sorting if needed
-        chapters_titles = list(self.chapters_data.keys())
-        if self.site_data['reverse'] == "1":
-            chapters_titles = list(reversed(chapters_titles))
+        # diff remote chapters against the manifest in one pass
+        new_chapters = []
+        remote_links = set()
+        # canonical links in the site's order
+        order = []
+        for chapter_title, chapter_link in self.chapters_list:
+            key = canonical_url(chapter_link)
+            if key in remote_links:
+                # listed twice by the site
+                continue
+            remote_links.add(key)
+            order.append(key)
+            chapter = manifest.get(key)
+            if chapter is None:
+                logging.info("New chapter: %s", chapter_title)
+                new_chapters.append((chapter_title, chapter_link))
+            elif chapter.title != chapter_title:
+                # renamed chapters keep their file
+                logging.info("Renamed chapter: %s -> %s",
+                             chapter.title, chapter_title)
+                chapter.title = chapter_title
+                changed = True
+
+        # removed chapters are kept locally, after the site's chapters
+        removed = []
+        for key, chapter in manifest.items():
+            if key not in remote_links:
+                logging.info("Chapter removed from site: %s", chapter.title)
+                removed.append(key)
+
+        # chapters inserted in the middle or filling gaps move chapters
+        order += removed
+        if order != list(manifest.keys()):
+            changed = True
+
+        if not changed and not new_chapters:
+            logging.info("No new chapters")
+            # chapters are already saved, only the page validators changed
+            if self.index_validators is not None:
+                save_validators(self.link, self.index_validators)
+            return False
 
         # get new chapters
         logging.info("Getting New Chapters")
-        for chapter_title in chapters_titles:
-            # ignore existing chapters
-            if chapter_title in existing_chapters_titles:
-                continue
-            # create chapter object
-            logging.info("New chapter: %s", chapter_title)
-            chapter = Chapter(self, chapter_title,
-                              self.chapters_data[chapter_title], self.cf)
-            # fetch chapter content
-            chapter.content = chapter.get_content(text_selector, self.scraper)
-            logging.info("Saving chapter: %s", chapter_title)
-            chapter.save()
-            # add to new chapters list
-            new_chapters.append(chapter)
+        used_paths = set(chapter.path for chapter in self.chapters)
+        for chapter in self.fetch_chapters(new_chapters, used_paths):
+            manifest.setdefault(canonical_url(chapter.link), chapter)
 
-        # update novel chapters
-        self.chapters = new_chapters
+        # rebuild chapters in the site's order reusing existing ones
+        self.chapters = [manifest[key] for key in order]
+        return True
 
     # loading methods
 
@@ -309,6 +676,65 @@ class Novel():
         # make sure novel object initialized
         assert(self.initialized is True)
 
+        manifest_path = os.path.join(self.path, 'chapters_manifest.json')
+        if os.path.isfile(manifest_path):
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+                f.close()
+        else:
+            manifest = self.load_legacy_manifest()
+
+        # add chapters saved by an interrupted update
+        saved_links = set(canonical_url(entry['link']) for entry in manifest)
+        for entry in self.read_journal():
+            if canonical_url(entry['link']) not in saved_links:
+                saved_links.add(canonical_url(entry['link']))
+                manifest.append(entry)
+
+        chapters = []
+        for entry in manifest:
+            chapters.append(self.load_chapter(entry))
+        return chapters
+
+    def load_chapter(self, entry):
+        """
+            loads a saved chapter, content is read when first used
+            params:
+                dict entry: {title, link, path} from the manifest or journal
+            return:
+                chapter: class Chapter
+        """
+        return Chapter(self, entry['title'], entry['link'],
+                       self.cf, path=entry['path'])
+
+    def read_journal(self):
+        """
+            reads chapters saved since the last complete save
+            return:
+                journal: list[dict{title, link, path}]
+        """
+        journal = []
+        if not os.path.isfile(self.journalPath):
+            return journal
+        with open(self.journalPath, 'r') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # last line may be cut by a crash
+                    continue
+                if self.store.exists(entry['path']):
+                    journal.append(entry)
+            f.close()
+        return journal
+
+    def load_legacy_manifest(self):
+        """
+            builds the chapters manifest from chapters_path.json and
+            chapters_data.json, used by novels saved before the manifest
+            return:
+                manifest: list[dict{title, link, path}]
+        """
         chapters_paths = {}
         with open(os.path.join(self.path, 'chapters_path.json')) as f:
             chapters_paths = json.loads(f.read())
@@ -319,16 +745,12 @@ class Novel():
             chapters_links = json.loads(f.read())
             f.close()
 
-        chapters = []
+        manifest = []
         for chapter_title, path in chapters_paths.items():
-            with open(path, 'r') as f:
-                content = f.read()
-                f.close()
-            chapter = Chapter(self, chapter_title,
-                              chapters_links[chapter_title],
-                              self.cf, content)
-            chapters.append(chapter)
-        return chapters
+            manifest.append({"title": chapter_title,
+                             "link": chapters_links[chapter_title],
+                             "path": path})
+        return manifest
 
     # saving methods
 
@@ -339,9 +761,7 @@ class Novel():
 
         logging.info("Savign Novel Data")
         file_path = os.path.join(self.path, "novel_data.json")
-        with open(file_path, "w") as f:
-            f.write(json.dumps(self.data))
-            f.close()
+        write_json_atomic(file_path, self.data)
 
     def save_chapters_data(self):
         """ saves chapters data {name:link} as json file in novel folder """
@@ -350,9 +770,7 @@ class Novel():
 
         logging.info("Saving Chapters Data")
         file_path = os.path.join(self.path, "chapters_data.json")
-        with open(file_path, "w") as f:
-            f.write(json.dumps(self.chapters_data))
-            f.close()
+        write_json_atomic(file_path, self.chapters_data)
 
     def save_chapters(self):
         """ saves each chapter and saves a json with their paths"""
@@ -361,16 +779,41 @@ class Novel():
 
         logging.info("Saving Chapters")
         chapter_paths = {}
+        manifest = []
         # store path and save chapter
         for chapter in self.chapters:
             chapter_paths[chapter.title] = chapter.path
+            manifest.append({"title": chapter.title, "link": chapter.link,
+                             "path": chapter.path})
             chapter.save()
+        self.store.set_numbers([chapter.path for chapter in self.chapters])
+
+        # store the manifest keeping order and duplicate titles
+        logging.info("Saving Chapters Manifest")
+        write_json_atomic(os.path.join(self.path, 'chapters_manifest.json'),
+                          manifest)
 
         # store paths as a json
         logging.info("Saving Chapters Paths")
-        with open(os.path.join(self.path, 'chapters_path.json'), 'w') as f:
-            f.write(json.dumps(chapter_paths))
-            f.close()
+        write_json_atomic(os.path.join(self.path, 'chapters_path.json'),
+                          chapter_paths)
+
+    def journal_chapter(self, chapter):
+        """ appends a saved chapter to the journal and flushes it to disk """
+        entry = {"title": chapter.title, "link": chapter.link,
+                 "path": chapter.path}
+        with self.journal_lock:
+            with open(self.journalPath, 'a') as f:
+                f.write(json.dumps(entry) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+                f.close()
+
+    def clear_journal(self):
+        """ removes the journal once everything is saved """
+        with self.journal_lock:
+            if os.path.isfile(self.journalPath):
+                os.remove(self.journalPath)
 
     def save(self):
         """ saves chapters, novel data and chapters data in novel's folder """
@@ -380,6 +823,85 @@ class Novel():
         self.save_novel_data()
         self.save_chapters_data()
         self.save_chapters()
+        self.clear_journal()
+        # dictionary is trained once the novel has enough chapters
+        if (self.compression is not None and
+           self.store.compressor.dictionary is None):
+            self.train_dictionary()
+        # validators are only stored once the chapters are saved
+        if self.index_validators is not None:
+            save_validators(self.link, self.index_validators)
+        get_catalog().record_update(clean_up_title(self.name),
+                                    len(self.chapters),
+                                    folder_size(self.path))
+
+    def migrate_storage(self, storage, compression=None):
+        """
+        moves all chapters to another storage backend
+        params:
+            str storage: 'folder' or 'sqlite'
+            str compression: None, 'zlib' or 'zstd'
+        """
+        # make sure novel object initialized
+        assert(self.initialized is True)
+        assert(storage in STORAGE_BACKENDS)
+        assert(compression is None or compression in COMPRESSION_METHODS)
+
+        if storage == self.storage and compression == self.compression:
+            return
+        logging.info("Moving chapters to %s storage (compression: %s)",
+                     storage, compression)
+        old_store = self.store
+        new_store = open_store(self.path, storage, compression)
+        for chapter in self.chapters:
+            chapter.save()
+        if compression is not None:
+            # the current dictionary file stays until the migration is
+            # saved, chapters not moved yet may still need it
+            new_store.compressor.dictionary = None
+            self.train_dictionary(new_store, pending=True)
+        for chapter in self.chapters:
+            new_store.write(chapter.path, old_store.read(chapter.path))
+
+        # both stores may share the same files, only remove old copies
+        # when they are kept apart
+        remove_old = storage != self.storage or (
+            storage == 'folder' and
+            (compression is None) != (self.compression is None))
+
+        self._store = new_store
+        self.storage = storage
+        self.compression = compression
+        self.data['storage'] = storage
+        self.data['compression'] = compression
+
+        # save everything in the new store before removing anything
+        self.save()
+        if compression is not None:
+            new_store.compressor.commit()
+        if remove_old:
+            for chapter in self.chapters:
+                old_store.remove(chapter.path)
+        old_store.close()
+
+    def train_dictionary(self, store=None, pending=False):
+        """
+        trains the novel's compression dictionary on its chapters
+        params:
+            store: store to train, novel's store if not provided
+            bool pending: keep the current dictionary file until the
+            store's compressor commits
+        """
+        store = self.store if store is None else store
+        if store.compressor is None:
+            return
+        if len(self.chapters) < DICT_MIN_SAMPLES:
+            return
+        logging.info("Training compression dictionary")
+        # samples spread over the whole novel
+        step = max(1, len(self.chapters) // DICT_MAX_SAMPLES)
+        samples = [chapter.content for chapter in self.chapters[::step]]
+        store.compressor.train(samples, pending)
 
     # Exporting methods
     # HTML
@@ -390,103 +912,250 @@ class Novel():
         return:
             str HTML: Generated HTML
         """
+        return ''.join(self.stream_html())
+
+    def stream_html(self, chapters=None):
+        """
+        Generates HTML from Template chunk by chunk,
+        chapters content is read only when its chunk is rendered
+        params:
+            list chapters: chapters to render, all chapters if None
+        return:
+            TemplateStream: iterable of HTML chunks
+        """
         # make sure novel object initialized
         assert(self.initialized is True)
 
         logging.info("Writing HTML File")
 
-        current_path = os.getcwd()
-        templates_folder = os.path.join(current_path, 'templates')
-        # set jinja2 enviroment
-        template_loader = jinja2.FileSystemLoader(searchpath=templates_folder)
-        template_env = jinja2.Environment(loader=template_loader,
-                                          autoescape=True)
-        TEMPLATE_FILE = "novel.html"
-        template = template_env.get_template(TEMPLATE_FILE)
-        output_text = template.render(novel=self)
+        if chapters is None:
+            chapters = self.chapters
 
-        return output_text
+        TEMPLATE_FILE = "novel.html"
+        template = get_template(TEMPLATE_FILE)
+        return template.stream(novel=self, chapters=chapters)
 
-    def export_as_html(self):
-        """ Exports Novel as HTML File """
+    def export_as_html(self, chapters=None):
+        """
+        Exports Novel as HTML File
+        params:
+            list chapters: chapters to export, all chapters if None
+        """
         # make sure novel object initialized
         assert(self.initialized is True)
 
         logging.info("Exporting as HTML")
 
         # Creates Exports folder if it doesn't exist
-        if not os.path.exists(os.path.join(self.path, 'Exports')):
-            os.mkdir(os.path.join(self.path, 'Exports'))
-
-        current_path = os.getcwd()
-        templates_folder = os.path.join(current_path, 'templates')
+        os.makedirs(self.exportsPath, exist_ok=True)
 
-        # save output_text to html file
-        html = self.write_html()
+        # stream html to a temporary file, renamed once complete
         file_path = os.path.join(self.path, 'Exports', self.name)+'.html'
-        with open(file_path, 'w') as f:
-            f.write(html)
-            f.close()
+        self.write_stream(self.stream_html(chapters), file_path)
+
+        self.export_assets()
+
+    def export_as_split_html(self, chapters=None):
+        """
+        Exports Novel as a light table of contents page and a file per
+        chapter, the reader loads chapters around the reading position
+        params:
+            list chapters: chapters to export, all chapters if None
+        """
+        # make sure novel object initialized
+        assert(self.initialized is True)
+
+        if chapters is None:
+            chapters = self.chapters
+
+        logging.info("Exporting as split HTML")
+
+        chapters_folder = os.path.join(self.exportsPath, 'chapters')
+        os.makedirs(chapters_folder, exist_ok=True)
+
+        # chapters are wrapped in scripts so they load from the disk
+        body_template = get_template("chapter_body.html")
+        fragment_template = get_template("chapter_fragment.js")
+        for number, chapter in enumerate(chapters, 1):
+            chapter_html = body_template.render(novel=self, chapter=chapter)
+            fragment = fragment_template.render(chapter_number=number,
+                                                chapter_html=chapter_html)
+            file_path = os.path.join(chapters_folder, f"{number}.js")
+            write_file_atomic(file_path, fragment)
+
+        # remove chapters left from a longer export
+        number = len(chapters) + 1
+        while os.path.isfile(os.path.join(chapters_folder, f"{number}.js")):
+            os.remove(os.path.join(chapters_folder, f"{number}.js"))
+            number += 1
+
+        template = get_template("novel_split.html")
+        file_path = os.path.join(self.exportsPath, self.name+' Split.html')
+        self.write_stream(template.stream(novel=self, chapters=chapters),
+                          file_path)
+
+        self.export_assets()
+
+    def write_stream(self, stream, file_path):
+        """
+        writes a template stream to a file in chunks
+        params:
+            TemplateStream stream
+            str file_path: destination, replaced once fully written
+        """
+        stream.enable_buffering(EXPORT_BUFFER_CHUNKS)
+        with atomic_file(file_path, 'w') as f:
+            stream.dump(f)
+
+    def export_assets(self):
+        """
+        publishes javascript, css and fonts to the exports assets folder,
+        only changed files are copied\n
+        files are hardlinked from the assets folder shared by all novels
+        when the filesystem allows it
+        """
+        templates_folder = os.path.join(os.getcwd(), 'templates')
+        shared_assets = os.path.join(os.getcwd(), 'Novels', 'assets')
+        assets_folder = os.path.join(self.exportsPath, 'assets')
 
-        # create assets folder with javascript and css files
         logging.info("Creating Assets")
-        if not os.path.exists(os.path.join(self.path, 'Exports', 'assets')):
-            os.mkdir(os.path.join(self.path, 'Exports', 'assets'))
-
-        css_path = os.path.join(templates_folder, 'style.css')
-        css_dst = os.path.join(self.path, 'Exports', 'assets', 'style.css')
-        if os.path.isfile(css_dst):
-            os.remove(css_dst)
-        copy(css_path, css_dst)
-
-        js_path = os.path.join(templates_folder, 'scripts')
-        js_dst = os.path.join(self.path, 'Exports', 'assets', 'scripts')
-        if os.path.isdir(js_dst):
-            rmtree(js_dst)
-        copytree(js_path, js_dst)
-
-        fonts_path = os.path.join(templates_folder, 'fonts')
-        fonts_dst = os.path.join(self.path, 'Exports', 'assets', 'fonts')
-        if os.path.isdir(fonts_dst):
-            rmtree(fonts_dst)
-        copytree(fonts_path, fonts_dst)
+        # html formats exporting at the same time share these folders
+        with _assets_lock:
+            for asset in EXPORT_ASSETS:
+                sync_asset(os.path.join(templates_folder, asset),
+                           os.path.join(shared_assets, asset))
+                sync_asset(os.path.join(shared_assets, asset),
+                           os.path.join(assets_folder, asset), link=True)
+
+    # EPUB
+    def export_as_epub(self, chapters=None):
+        """
+        Exports Novel as EPUB File\n
+        chapters are rendered one at a time straight into the zip file
+        params:
+            list chapters: chapters to export, all chapters if None
+        """
+        # make sure novel object initialized
+        assert(self.initialized is True)
+
+        logging.info("Exporting as EPUB")
+
+        if chapters is None:
+            chapters = self.chapters
+        os.makedirs(self.exportsPath, exist_ok=True)
+        templates_folder = os.path.join(os.getcwd(), 'templates')
+        epub_dst = os.path.join(self.exportsPath, self.name+'.epub')
+
+        book_id = 'urn:uuid:' + str(uuid.uuid5(uuid.NAMESPACE_URL,
+                                               str(self.link)))
+        modified = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+        cover_data, cover_type = self.load_cover()
+        cover = None
+        if cover_data is not None:
+            cover = 'cover' + (mimetypes.guess_extension(cover_type) or '')
+
+        chapter_template = get_template("epub_chapter.xhtml")
+        # only titles are kept for the table of contents
+        toc = []
+        with atomic_path(epub_dst) as tmp_path, \
+                zipfile.ZipFile(tmp_path, 'w', zipfile.ZIP_DEFLATED) as epub:
+            # mimetype has to be the first file, uncompressed
+            epub.writestr('mimetype', 'application/epub+zip',
+                          compress_type=zipfile.ZIP_STORED)
+            epub.writestr('META-INF/container.xml',
+                          get_template("epub_container.xml").render())
+            epub.write(os.path.join(templates_folder, 'epub_style.css'),
+                       'OEBPS/style.css')
+            if cover is not None:
+                epub.writestr('OEBPS/' + cover, cover_data)
+
+            for number, chapter in enumerate(chapters, 1):
+                chapter_path = f'OEBPS/chapter_{number}.xhtml'
+                with epub.open(chapter_path, 'w') as f:
+                    for chunk in chapter_template.generate(
+                            chapter=chapter, chapter_number=number):
+                        f.write(chunk.encode())
+                toc.append((number, chapter.title))
+
+            context = {"novel": self, "toc": toc, "book_id": book_id,
+                       "modified": modified, "cover": cover,
+                       "cover_type": cover_type}
+            epub.writestr('OEBPS/nav.xhtml',
+                          get_template("epub_nav.xhtml").render(context))
+            epub.writestr('OEBPS/toc.ncx',
+                          get_template("epub_toc.ncx").render(context))
+            epub.writestr('OEBPS/content.opf',
+                          get_template("epub_package.opf").render(context))
+
+    def load_cover(self):
+        """
+        downloads the novel's cover image
+        return:
+            tuple:
+                data: bytes (None if it couldn't be downloaded)
+                media_type: str
+        """
+        cover_link = self.data.get('cover_link')
+        if not cover_link:
+            return None, None
+        session = self.scraper if self.scraper is not None else get_session()
+        try:
+            response = fetch(session, cover_link)
+        except novel_exceptions.PageLoadError as e:
+            logging.warning("Couldn't download cover: %s", e)
+            return None, None
+        media_type = response.headers.get('Content-Type', '')
+        media_type = media_type.split(';')[0].strip()
+        if not media_type.startswith('image/'):
+            media_type = (mimetypes.guess_type(cover_link)[0] or
+                          'image/jpeg')
+        return response.content, media_type
 
     # PDF
-    def write_pdf_as_html(self, dark_mode=False):
+    def write_pdf_as_html(self, dark_mode=False, chapters=None,
+                          header=True):
         """
         Generates PDF Content as HTML from Template
+        params:
+            bool dark_mode
+            list chapters: chapters to include, all chapters if None
+            bool header: include the novel's cover and description
         return:
             str HTML: Generated HTML
         """
         # make sure novel object initialized
         assert(self.initialized is True)
 
-        logging.info("Creating PDF")
-
-        current_path = os.getcwd()
-        templates_folder = os.path.join(current_path, 'templates')
+        if chapters is None:
+            chapters = self.chapters
 
-        # set jinja2 enviroment
-        template_loader = jinja2.FileSystemLoader(searchpath=templates_folder)
-        template_env = jinja2.Environment(loader=template_loader,
-                                          autoescape=True)
         TEMPLATE_FILE = "pdf_novel.html"
-
-        template = template_env.get_template(TEMPLATE_FILE)
-        output_text = template.render(novel=self, dark_mode=dark_mode)
+        template = get_template(TEMPLATE_FILE)
+        output_text = template.render(novel=self, chapters=chapters,
+                                      header=header, dark_mode=dark_mode)
 
         return output_text
 
-    def export_as_pdf(self, dark_mode=False):
-        """ Exports Novel as PDF File """
+    def export_as_pdf(self, dark_mode=False, workers=None, range_size=None,
+                      chapters=None):
+        """
+        Exports Novel as PDF File\n
+        chapters are split into ranges laid out by worker processes then
+        merged, so memory stays bounded and all cores are used\n
+        laid out ranges are cached in Exports/.pdf_cache
+        params:
+            bool dark_mode
+            int workers: worker processes, cpu count if None
+            int range_size: chapters per range, PDF_RANGE_SIZE if None
+            list chapters: chapters to export, all chapters if None
+        """
         # make sure novel object initialized
         assert(self.initialized is True)
 
         logging.info("Exporting as PDF")
 
-        # Creates novel folder if it doesn't exist
-        if not os.path.exists(self.path):
-            os.mkdir(self.path)
+        # Creates exports folder if it doesn't exist
+        os.makedirs(self.exportsPath, exist_ok=True)
         # important Paths
         templates_folder = os.path.join(os.getcwd(), 'templates')
         css_file_suffix = '_dark' if dark_mode else '_light'
@@ -497,28 +1166,153 @@ class Novel():
             pdf_dst = os.path.join(self.path, 'Exports',
                                    self.name+' Dark'+'.pdf')
 
-        html = self.write_pdf_as_html(dark_mode)
-        # delete older pdf if exists
-        if os.path.isfile(pdf_dst):
-            os.remove(pdf_dst)
-        # write pdf file
-        HTML(string=html).write_pdf(pdf_dst, stylesheets=[CSS(css_path)])
+        workers = workers or os.cpu_count() or 1
+        range_size = max(1, range_size or PDF_RANGE_SIZE)
+        if chapters is None:
+            chapters = self.chapters
+        ranges = [chapters[i:i+range_size]
+                  for i in range(0, len(chapters), range_size)]
+
+        # parts can't be merged, render in one piece
+        if PdfWriter is None:
+            logging.info("Creating PDF")
+            html = self.write_pdf_as_html(dark_mode, chapters)
+            with atomic_path(pdf_dst) as tmp_path:
+                render_part(html, css_path, tmp_path)
+            return
+
+        # parts are cached by their content, template and theme so a
+        # re-export only lays out new or changed chapters
+        cache_dir = os.path.join(self.exportsPath, '.pdf_cache')
+        # pdf and pdf_dark can run at the same time
+        os.makedirs(cache_dir, exist_ok=True)
+        theme = 'dark' if dark_mode else 'light'
+        version = pdf_template_version(css_path)
+        parts_paths = []
+        for n, part_chapters in enumerate(ranges):
+            key = self.pdf_part_key(part_chapters, n == 0, version)
+            parts_paths.append(os.path.join(cache_dir,
+                                            f"{theme}-{key}.pdf"))
+
+        missing = [n for n, path in enumerate(parts_paths)
+                   if not os.path.isfile(path)]
+        metrics.count('cache_hits', len(ranges) - len(missing), cache='pdf')
+        metrics.count('cache_misses', len(missing), cache='pdf')
+        logging.info("Reusing %d of %d PDF parts",
+                     len(ranges) - len(missing), len(ranges))
+        # exports run on threads, inside the gui too, a forked worker
+        # would copy their locks, sqlite connections and qt state
+        with ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context('spawn')) as executor:
+            # only a few parts html are kept in memory at once
+            pending = {}
+            for n in missing:
+                if len(pending) >= workers:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        future.result()
+                        commit_temp(*pending.pop(future))
+                logging.info("Creating PDF part %d/%d", n+1, len(ranges))
+                html = self.write_pdf_as_html(dark_mode, ranges[n],
+                                              header=(n == 0))
+                # parts land in the cache only once fully written
+                tmp_path = temp_path(parts_paths[n])
+                future = executor.submit(render_part, html, css_path,
+                                         tmp_path)
+                pending[future] = (tmp_path, parts_paths[n])
+            for future, paths in pending.items():
+                future.result()
+                commit_temp(*paths)
+
+        logging.info("Merging PDF parts")
+        merge_parts(parts_paths, pdf_dst)
+
+        # drop parts of older exports of this theme
+        for file_name in os.listdir(cache_dir):
+            file_path = os.path.join(cache_dir, file_name)
+            if (file_name.startswith(theme + '-') and
+               file_path not in parts_paths):
+                os.remove(file_path)
+
+    def pdf_part_key(self, chapters, header, version):
+        """
+        hashes what a pdf part is made of
+        params:
+            list chapters: part's chapters
+            bool header: part includes the novel's header
+            str version: templates version
+        return:
+            key: str
+        """
+        part_hash = hashlib.sha256(version.encode())
+        if header:
+            for field in ('cover_link', 'description'):
+                part_hash.update(str(self.data.get(field)).encode())
+            part_hash.update(self.name.encode())
+        for chapter in chapters:
+            part_hash.update(chapter.title.encode() + b'\0')
+            part_hash.update(chapter.digest.encode())
+        return part_hash.hexdigest()
 
 
 class Chapter():
-    def __init__(self, novel, title, link, cf=False, content=""):
+    """
+    Chapter Class - a chapter's metadata, content is loaded on first use\n
+    params:
+        Novel novel: chapter's novel
+        str title: chapter's title
+        str link: chapter's link
+        bool cf: chapter's host is cloudflare protected or not
+        str content: chapter's content, None to load it from the store
+        str path: chapter's path in the store
+    """
+    # thousands of chapters are kept in memory, keep them small
+    __slots__ = ('novel', 'title', 'link', 'path', 'cf', '_content')
+
+    def __init__(self, novel, title, link, cf=False, content=None,
+                 path=None):
         # main variables
         self.novel = novel
         self.title = title
         self.link = link
-        self.content = content
-        self.path = os.path.join(self.novel.path, clean_filename(self.title))
+        # content not saved yet, None once it's in the store
+        self._content = content
+        self.path = path
+        if self.path is None:
+            self.path = os.path.join(self.novel.path,
+                                     clean_filename(self.title))
         # technical variables
         self.cf = cf
 
     def __repr__(self):
         return self.novel.name + "-" + self.title
 
+    @property
+    def content(self):
+        """ chapter's content, read from the store when needed """
+        if self._content is not None:
+            return self._content
+        content = content_cache.get(self.path)
+        if content is None:
+            content = self.novel.store.read(self.path)
+            content_cache.put(self.path, content)
+        return content
+
+    @content.setter
+    def content(self, content):
+        self._content = content
+
+    @property
+    def paragraphs(self):
+        """ chapter's content split into paragraphs """
+        return self.content.split("\n")
+
+    @property
+    def digest(self):
+        """ hash of chapter's content """
+        return hashlib.sha256(self.content.encode()).hexdigest()
+
     def get_content(self, css_selector, scraper):
         """
             gets chapter content
@@ -527,39 +1321,35 @@ class Chapter():
             return:
                 content: str
         """
+        novel_name = self.novel.name
         # get chapter page html source
-        if self.cf:
-            html = load_cfpage(self.link, scraper)
-        else:
-            html = load_page(self.link)
+        with metrics.timer('fetch', novel_name):
+            if self.cf:
+                html = load_cfpage(self.link, scraper)
+            else:
+                html = load_page(self.link)
 
-        # parse html source
-        bs4 = BeautifulSoup(html, "html.parser")
-        chapter_content = bs4.select(css_selector)
+        with metrics.timer('parse', novel_name):
+            # parse only the parts of the page the selector needs
+            chapter_content = select(html, css_selector, self.novel.parser)
 
-        # get chapter content
-        chapter_paragraphs = []
-        for p in chapter_content:
-            chapter_paragraphs.append(p.get_text())
-        content = '\n'.join(chapter_paragraphs)
+            # get chapter content
+            chapter_paragraphs = []
+            for p in chapter_content:
+                chapter_paragraphs.append(p.get_text())
+            content = '\n'.join(chapter_paragraphs)
 
-        # encode than decode to avoid any problems
-        content = content.encode("ascii", "ignore").decode()
-        content = clean_text(content)
+        with metrics.timer('clean', novel_name):
+            # encode than decode to avoid any problems
+            content = content.encode("ascii", "ignore").decode()
+            content = clean_text(content)
         return content
 
     def save(self):
-        """ saves chapter as txt file """
-        # ignore chapter if already exists, if not save it
-        if os.path.isfile(self.path):
-            with open(self.path) as f:
-                # and same content
-                if f.read() == self.content:
-                    pass
-                else:
-                    f.write(self.content)
-                f.close()
-        else:
-            with open(self.path, 'x') as f:
-                f.write(self.content)
-                f.close()
+        """ saves chapter's content in novel's store if it isn't saved """
+        if self._content is None:
+            return
+        self.novel.store.write(self.path, self._content)
+        # saved content only stays in memory through the cache
+        content_cache.put(self.path, self._content)
+        self._content = None
@@ -0,0 +1,183 @@
+from markupsafe import escape, Markup
+
+from catalog import get_catalog
+from metrics import metrics
+from helper_functions import clean_up_title, folder_size
+
+import os
+import time
+import hashlib
+import logging
+import tempfile
+import threading
+from collections.abc import Sequence
+from concurrent.futures import ThreadPoolExecutor
+
+EXPORT_FORMATS = ('html', 'split_html', 'pdf', 'pdf_dark', 'epub')
+# characters of prepared chapters kept in memory, the rest is spilled to
+# disk
+EXPORT_MEMORY_LIMIT = 64 * 1024 * 1024
+
+
+class ExportChapter():
+    """
+    ExportChapter Class - a chapter prepared once for every export format\n
+    params:
+        str title: chapter's title
+        list paragraphs: chapter's escaped paragraphs
+        str digest: hash of chapter's content
+    """
+    __slots__ = ('title', 'paragraphs', 'digest')
+
+    def __init__(self, title, paragraphs, digest):
+        self.title = title
+        self.paragraphs = paragraphs
+        self.digest = digest
+
+
+def prepare_chapter(chapter):
+    """
+    splits and escapes a chapter's content, so templates don't do it per
+    format, and hashes it\n
+    params:
+        Chapter chapter
+    return:
+        chapter: ExportChapter
+    """
+    content = chapter.content
+    paragraphs = [escape(paragraph) for paragraph in content.split("\n")]
+    digest = hashlib.sha256(content.encode()).hexdigest()
+    return ExportChapter(chapter.title, paragraphs, digest)
+
+
+class PreparedChapters(Sequence):
+    """
+    PreparedChapters Class - a novel's chapters prepared once, shared by
+    every format\n
+    chapters are kept in memory up to EXPORT_MEMORY_LIMIT, the others
+    are spilled to a temporary file and read back as they are\n
+    params:
+        list items: ExportChapter or (title, digest, position, size) of
+            a spilled chapter
+        file spill: temporary file of spilled chapters
+        Lock lock: guards reads of the spill file
+    """
+    def __init__(self, items, spill=None, lock=None):
+        self.items = items
+        self.spill = spill
+        self.lock = lock or threading.Lock()
+
+    def __len__(self):
+        return len(self.items)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return PreparedChapters(self.items[index], self.spill,
+                                    self.lock)
+        item = self.items[index]
+        if isinstance(item, ExportChapter):
+            return item
+        title, digest, position, size = item
+        with self.lock:
+            self.spill.seek(position)
+            data = self.spill.read(size)
+        # paragraphs were escaped before being spilled
+        paragraphs = [Markup(paragraph)
+                      for paragraph in data.decode().split("\n")]
+        return ExportChapter(title, paragraphs, digest)
+
+    def close(self):
+        """ removes the spill file """
+        if self.spill is not None:
+            self.spill.close()
+
+
+def prepare_chapters(novel, memory_limit=EXPORT_MEMORY_LIMIT):
+    """
+    reads, splits, escapes and hashes every chapter once\n
+    params:
+        Novel novel: initialized novel
+        int memory_limit: characters of prepared chapters kept in memory
+    return:
+        chapters: PreparedChapters
+    """
+    items = []
+    spill = None
+    kept = 0
+    for chapter in novel.chapters:
+        prepared = prepare_chapter(chapter)
+        size = sum(len(paragraph) + 1 for paragraph in prepared.paragraphs)
+        if kept + size <= memory_limit:
+            kept += size
+            items.append(prepared)
+            continue
+        data = "\n".join(prepared.paragraphs).encode()
+        if spill is None:
+            spill = tempfile.TemporaryFile()
+        items.append((prepared.title, prepared.digest, spill.tell(),
+                      len(data)))
+        spill.write(data)
+    if spill is not None:
+        logging.info("Spilled %d prepared chapters to disk",
+                     sum(not isinstance(item, ExportChapter)
+                         for item in items))
+    return PreparedChapters(items, spill)
+
+
+def export_novel(novel, formats=EXPORT_FORMATS, pdf_workers=None):
+    """
+    exports a novel to several formats from the same chapters sequence,
+    formats run concurrently
+    params:
+        Novel novel: initialized novel
+        tuple formats: formats from EXPORT_FORMATS
+        int pdf_workers: processes shared by pdf formats, cpu count if None
+    return:
+        timings: dict{step: seconds}
+    """
+    timings = {}
+    start = time.perf_counter()
+    with metrics.novel(novel.name):
+        chapters = prepare_chapters(novel)
+    timings['prepare'] = time.perf_counter() - start
+    metrics.observe('export_prepare', timings['prepare'], novel.name)
+
+    # pdf formats split the processes between them
+    pdf_formats = [name for name in formats if name.startswith('pdf')]
+    pdf_workers = pdf_workers or os.cpu_count() or 1
+    if pdf_formats:
+        pdf_workers = max(1, pdf_workers // len(pdf_formats))
+
+    exporters = {
+        'html': lambda: novel.export_as_html(chapters),
+        'split_html': lambda: novel.export_as_split_html(chapters),
+        'pdf': lambda: novel.export_as_pdf(False, pdf_workers,
+                                           chapters=chapters),
+        'pdf_dark': lambda: novel.export_as_pdf(True, pdf_workers,
+                                                chapters=chapters),
+        'epub': lambda: novel.export_as_epub(chapters),
+    }
+
+    def run(name):
+        format_start = time.perf_counter()
+        with metrics.novel(novel.name):
+            exporters[name]()
+        seconds = time.perf_counter() - format_start
+        metrics.observe('export_' + name, seconds, novel.name)
+        return seconds
+
+    try:
+        with ThreadPoolExecutor(max_workers=len(formats) or 1) as executor:
+            futures = {name: executor.submit(run, name) for name in formats}
+            for name, future in futures.items():
+                timings[name] = future.result()
+    finally:
+        chapters.close()
+    timings['total'] = time.perf_counter() - start
+    get_catalog().record_export(clean_up_title(novel.name),
+                                folder_size(novel.path))
+
+    logging.info("Export summary for %s:", novel.name)
+    for step, seconds in timings.items():
+        logging.info("    %s: %.2fs", step, seconds)
+    return timings
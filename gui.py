@@ -1,3 +1,5 @@
+import time
+import queue
 import logging
 import logging.config
 
@@ -7,13 +9,22 @@ import PyQt5.QtCore
 from PyQt5.QtWidgets import *
 from PyQt5.QtGui import QTextCursor
 
-from helper_functions import load_novels_list, get_site_domain, get_novel_path
+from helper_functions import load_novels_list, get_novel_path
+from catalog import get_catalog
+from metrics import metrics
 
 from classes import Novel
+from export import export_novel
+from scheduler import BatchUpdater
 
 logging.config.fileConfig(fname='log.conf')
 logger = logging.getLogger(__name__)
 
+# ms between two updates of the log panel
+LOG_FLUSH_INTERVAL = 200
+# lines kept in the log panel
+LOG_MAX_LINES = 5000
+
 
 class NewNovelWorker(PyQt5.QtCore.QRunnable):
     log = PyQt5.QtCore.pyqtSignal(str)
@@ -30,6 +41,7 @@ class NewNovelWorker(PyQt5.QtCore.QRunnable):
             novel = Novel(self.novelName, link=self.novelLink)
             novel.initialize()
             novel.save()
+            metrics.export()
         else:
             print(None, None)
 
@@ -50,8 +62,24 @@ class UpdateNovelWorker(PyQt5.QtCore.QRunnable):
         global app
         novel = Novel(self.novelName, load=True)
         novel.initialize()
-        novel.update()
-        novel.save()
+        if novel.update():
+            novel.save()
+        metrics.export()
+
+        self.app.novelsList.reload()
+        self.app.enable()
+
+
+class BatchUpdateWorker(PyQt5.QtCore.QRunnable):
+    log = PyQt5.QtCore.pyqtSignal(str)
+
+    def __init__(self, app):
+        super(BatchUpdateWorker, self).__init__()
+        self.app = app
+
+    @PyQt5.QtCore.pyqtSlot()
+    def run(self):
+        BatchUpdater().run()
 
         self.app.novelsList.reload()
         self.app.enable()
@@ -70,9 +98,8 @@ class ExportNovelWorker(PyQt5.QtCore.QRunnable):
         global app
         novel = Novel(self.novelName, load=True)
         novel.initialize()
-        novel.export_as_html()
-        novel.export_as_pdf()
-        novel.export_as_pdf(dark_mode=True)
+        export_novel(novel, ('html', 'pdf', 'pdf_dark'))
+        metrics.export()
 
         self.app.novelsList.reload()
         self.app.enable()
@@ -81,13 +108,23 @@ class ExportNovelWorker(PyQt5.QtCore.QRunnable):
 class LogText(QPlainTextEdit):
     def __init__(self):
         super(QPlainTextEdit, self).__init__()
+        # oldest lines are dropped so memory stays bounded
+        self.setMaximumBlockCount(LOG_MAX_LINES)
 
     def addLine(self, line):
-        self.appendPlainText(line)
+        self.addLines([line])
+
+    def addLines(self, lines):
+        self.appendPlainText('\n'.join(lines))
         self.moveCursor(QTextCursor.End)
 
 
 class Log(logging.Handler):
+    """
+    logging handler showing records in the log panel\n
+    records from any thread are queued and the panel is only updated
+    from the gui thread, in batches on a timer
+    """
     def __init__(self):
         super().__init__()
         # For Debugging
@@ -95,14 +132,33 @@ class Log(logging.Handler):
         format = "[%(levelname)s][%(asctime)s]: %(message)s"
 
         self.formatter = logging.Formatter(format)
+        self.queue = queue.SimpleQueue()
 
         self.widget = LogText()
         self.widget.setStyleSheet("background-color:white;")
         self.widget.setReadOnly(True)
 
+        # the timer lives in the gui thread with the widget
+        self.timer = PyQt5.QtCore.QTimer(self.widget)
+        self.timer.timeout.connect(self.flushQueue)
+        self.timer.start(LOG_FLUSH_INTERVAL)
+
     def emit(self, record):
-        msg = self.format(record)
-        self.widget.addLine(msg)
+        try:
+            self.queue.put(self.format(record))
+        except Exception:
+            self.handleError(record)
+
+    def flushQueue(self):
+        lines = []
+        while True:
+            try:
+                lines.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        if lines:
+            # lines past the panel's limit would be dropped anyway
+            self.widget.addLines(lines[-LOG_MAX_LINES:])
 
     def write(self, m):
         pass
@@ -190,6 +246,9 @@ class ButtonsBox(QWidget):
         self.updateButton.setFixedHeight(50)
         self.updateButton.setDisabled(True)
 
+        self.updateAllButton = QPushButton("Update All Novels")
+        self.updateAllButton.setFixedHeight(50)
+
         self.exportButton = QPushButton("Export Selected Novel")
         self.exportButton.setFixedHeight(50)
         self.exportButton.setDisabled(True)
@@ -200,9 +259,14 @@ class ButtonsBox(QWidget):
 
         self.vLayout.addWidget(self.newNovelButton)
         self.vLayout.addWidget(self.updateButton)
+        self.vLayout.addWidget(self.updateAllButton)
         self.vLayout.addWidget(self.exportButton)
 
 
+def format_time(timestamp):
+    return time.strftime('%Y-%m-%d %H:%M', time.localtime(timestamp))
+
+
 class InfoBox(QScrollArea):
     def __init__(self):
         super(QScrollArea, self).__init__()
@@ -226,21 +290,34 @@ class InfoBox(QScrollArea):
         self.linkLabel.setOpenExternalLinks(True)
         self.vLayout.addWidget(self.linkLabel)
 
+        self.detailsLabel = QLabel()
+        self.detailsLabel.setContentsMargins(0, 0, 0, 10)
+        self.vLayout.addWidget(self.detailsLabel)
+
         self.openNovelDir = QPushButton("Open Folder")
         self.vLayout.addWidget(self.openNovelDir)
 
         self.openExportsDir = QPushButton("Open Exports Folder")
         self.vLayout.addWidget(self.openExportsDir)
 
-    def showInfo(self, name, url):
+    def showInfo(self, entry):
+        name = entry['name']
         self.name = name
         self.path = get_novel_path(name)
         self.nameLabel.setText(name)
 
-        self.url = url
-        link = f"Link: <a href=\"{url}\">{get_site_domain(url)}</a>"
+        self.url = entry['link']
+        link = f"Link: <a href=\"{self.url}\">{entry['domain']}</a>"
         self.linkLabel.setText(link)
 
+        details = (f"{entry['chapters']} chapters, "
+                   f"{entry['size'] / 2**20:.1f} MB")
+        if entry['updated_at']:
+            details += "\nUpdated: " + format_time(entry['updated_at'])
+        if entry['exported_at']:
+            details += "\nExported: " + format_time(entry['exported_at'])
+        self.detailsLabel.setText(details)
+
         novelFolder = get_novel_path(self.name)
         self.openNovelDir.clicked.connect(lambda x: startfile(novelFolder))
 
@@ -262,15 +339,16 @@ class BottomArea(QWidget):
         self.grid.addWidget(self.infoBox, 0, 1, 1, 3)
         self.infoBox.setHidden(True)
 
-    #    self.log = Log()
-    #    self.grid.addWidget(self.log.widget, 1, 0, 2, 4)
+        self.log = Log()
+        self.log.widget.setFixedHeight(180)
+        self.grid.addWidget(self.log.widget, 1, 0, 2, 4)
 
 
 class App(QWidget):
     def __init__(self):
         super(QWidget, self).__init__()
         self.setWindowTitle("Web Novels Reader")
-        self.setFixedSize(620, 600)
+        self.setFixedSize(620, 800)
 
         self.threadPool = PyQt5.QtCore.QThreadPool()
 
@@ -293,22 +371,23 @@ class App(QWidget):
         self.updateButton = self.buttonsBox.updateButton
         self.updateButton.clicked.connect(self.updateNovel)
 
+        self.updateAllButton = self.buttonsBox.updateAllButton
+        self.updateAllButton.clicked.connect(self.updateAllNovels)
+
         self.exportButton = self.buttonsBox.exportButton
         self.exportButton.clicked.connect(self.exportNovel)
 
         self.infoBox = self.bottomArea.infoBox
 
-    #    self.log = self.bottomArea.log
+        self.log = self.bottomArea.log
 
     def novelSelected(self, selectedItem):
         self.buttonsBox.updateButton.setDisabled(False)
         self.buttonsBox.exportButton.setDisabled(False)
         self.infoBox.setHidden(False)
 
-        novels_list = load_novels_list()
         name = selectedItem.text()
-        link = novels_list[name]
-        self.infoBox.showInfo(name, link)
+        self.infoBox.showInfo(get_catalog().get(name))
 
     def addNovel(self):
         newNovelDialog = NewNovelDialog(self)
@@ -326,6 +405,12 @@ class App(QWidget):
 
         self.disable()
 
+    def updateAllNovels(self):
+        batchUpdateWorker = BatchUpdateWorker(self)
+        self.threadPool.start(batchUpdateWorker)
+
+        self.disable()
+
     def exportNovel(self):
         name = self.novelsList.selectedItems()[0].text()
         exportNovelWorker = ExportNovelWorker(name, self)
@@ -1,9 +1,35 @@
 from urllib.parse import urlparse
 import re
-import requests
 import os
 import json
 import time
+import threading
+import hashlib
+import shutil
+import logging
+
+from network import HOST_CONCURRENCY, HostSemaphore, get_session, fetch
+from network import load_validators, validators_headers, response_validators
+from catalog import get_catalog
+from metrics import metrics
+from atomic_write import atomic_path, write_json_atomic
+
+# content hashes of files by (path, size, modification time)
+_file_hashes = {}
+_file_hashes_lock = threading.Lock()
+
+_host_semaphores = {}
+_host_semaphores_lock = threading.Lock()
+
+# sites data cache
+SITES_CACHE_FILE = os.path.join(os.getcwd(), 'Cache', 'sites_data.json')
+BUNDLED_SITES_DATA_FILE = os.path.join(os.getcwd(), 'sites_data.json')
+# seconds before cached site data gets refreshed
+SITE_DATA_TTL = 24 * 60 * 60
+
+_sites_cache = None
+_sites_cache_lock = threading.Lock()
+_sites_refreshing = set()
 
 
 def load_page(link):
@@ -12,15 +38,11 @@ def load_page(link):
     params:\n
         str link: page's link\n
     return:
-        page html: string"""
-    no_tries = 0
-    while no_tries < 3:
-        try:
-            page = requests.get(link)
-            return page.text
-        except Exception:
-            no_tries += 1
-            time.sleep(3)
+        page html: string
+    raises:
+        PageLoadError: the page failed to load after every retry"""
+    page = fetch(get_session(), link)
+    return page.text
 
 
 def load_cfpage(link, cfscraper):
@@ -32,55 +54,150 @@ def load_cfpage(link, cfscraper):
         CloudflareScrapper cfscrapper: scraper object
     return:
         page html: str
+    raises:
+        PageLoadError: the page failed to load after every retry
+    """
+    page = fetch(cfscraper, link)
+    return str(page.content)
+
+
+def get_host_semaphore(host, limit=HOST_CONCURRENCY):
+    """
+    gets the semaphore limiting concurrent requests to a host\n
+    the same semaphore is shared by every novel on that host, its limit
+    is the largest one asked for\n
+    params:
+        str host: host's domain
+        int limit: max concurrent requests
+    return:
+        semaphore: HostSemaphore
+    """
+    with _host_semaphores_lock:
+        if host not in _host_semaphores:
+            _host_semaphores[host] = HostSemaphore(limit)
+        semaphore = _host_semaphores[host]
+    semaphore.raise_limit(limit)
+    return semaphore
+
+
+def load_page_if_modified(link, cfscraper=None, conditional=True):
+    """
+    loads a webpage only if it changed since the last stored validators\n
+    params:
+        str link: page's link
+        CloudflareScrapper cfscrapper: scraper object for protected pages
+        bool conditional: send the stored validators or not
+    return:
+        tuple:
+            page html: str (None if it wasn't modified or failed to load)
+            validators: dict{etag, last_modified} of the loaded page
+                (None if it wasn't modified)
     """
-    no_tries = 0
-    while no_tries < 3:
-        try:
-            page = cfscraper.get(link)
-            return str(page.content)
-        except Exception:
-            no_tries += 1
-            time.sleep(3)
+    headers = {}
+    if conditional:
+        headers = validators_headers(load_validators(link))
+    session = cfscraper if cfscraper is not None else get_session()
+
+    page = fetch(session, link, headers=headers)
+    if page.status_code == 304:
+        metrics.count('cache_hits', cache='not_modified')
+        return None, None
+    if headers:
+        metrics.count('cache_misses', cache='not_modified')
+    html = str(page.content) if cfscraper is not None else page.text
+    return html, response_validators(page)
 
 
 def load_novels_list():
     """
-    reads novels_list.json and returns dict with all novels
+    gets all novels from the library catalog
     return:
         novels_list: dict{name: str link}
     """
-    file = 'novels_list.json'
-    # check if json file exists, if not adds it
-    if not os.path.exists(file):
-        with open(file, 'w') as f:
-            f.write('{}')
-            f.close
-        return {}
-    # reads json and returns novels list
-    else:
-        with open(file, 'r') as f:
-            novels_list = json.load(f)
+    return get_catalog().links()
+
+
+def _read_sites_cache():
+    """ reads the cached sites data, seeded from the bundled file """
+    sites_cache = {}
+    if os.path.isfile(BUNDLED_SITES_DATA_FILE):
+        with open(BUNDLED_SITES_DATA_FILE, 'r') as f:
+            bundled = json.load(f)
+            f.close()
+        # bundled data is treated as stale so it gets refreshed when online
+        for domain, data in bundled.items():
+            sites_cache[domain] = {"fetched_at": 0, "data": data}
+    if os.path.isfile(SITES_CACHE_FILE):
+        with open(SITES_CACHE_FILE, 'r') as f:
+            sites_cache.update(json.load(f))
             f.close()
-        return novels_list
+    return sites_cache
+
+
+def _fetch_site_data(sd):
+    """ requests site data from the api and stores it in the cache """
+    request_url = f"https://novels-reader-api.herokuapp.com/sitesdata/{sd}"
+    request = fetch(get_session(), request_url)
+    site_data = json.loads(request.text)
+
+    entry = {"fetched_at": time.time(), "data": site_data}
+    with _sites_cache_lock:
+        _sites_cache[sd] = entry
+        disk_cache = {}
+        if os.path.isfile(SITES_CACHE_FILE):
+            with open(SITES_CACHE_FILE, 'r') as f:
+                disk_cache = json.load(f)
+                f.close()
+        disk_cache[sd] = entry
+        write_json_atomic(SITES_CACHE_FILE, disk_cache)
+    return site_data
+
+
+def _refresh_site_data(sd):
+    """ refreshes stale site data in the background """
+    try:
+        _fetch_site_data(sd)
+    except Exception as e:
+        logging.warning("Couldn't refresh site data for %s: %s", sd, e)
+    finally:
+        with _sites_cache_lock:
+            _sites_refreshing.discard(sd)
 
 
 def load_site_data(sd):
     """
-    gets needed data for the novel's host from sites_data.json\n
+    gets needed data for the novel's host\n
+    data is shared by all novels on the same domain and cached for
+    SITE_DATA_TTL seconds, after that the cached data is still used
+    while it gets refreshed in the background\n
+    the cache can be seeded from sites_data.json\n
     params:
         str sd: site_domain
     return:\n
         site_data: dict
     """
-    # try sending api request for site data
-    request_url = f"https://novels-reader-api.herokuapp.com/sitesdata/{sd}"
-    request = requests.get(request_url)
-    return json.loads(request.text)
+    global _sites_cache
+    with _sites_cache_lock:
+        if _sites_cache is None:
+            _sites_cache = _read_sites_cache()
+        entry = _sites_cache.get(sd)
+        if entry is not None:
+            metrics.count('cache_hits', cache='site_data')
+            age = time.time() - entry["fetched_at"]
+            if age > SITE_DATA_TTL and sd not in _sites_refreshing:
+                _sites_refreshing.add(sd)
+                threading.Thread(target=_refresh_site_data, args=(sd,),
+                                 daemon=True).start()
+            return entry["data"]
+
+    # nothing cached, the api request has to block
+    metrics.count('cache_misses', cache='site_data')
+    return _fetch_site_data(sd)
 
 
 def add_to_novels_list(name, link):
     """
-    adds novel to novels_list.json\n
+    adds novel to the library catalog\n
     paramas:\n
         str name: novel's name
         str link: novel's link
@@ -88,11 +205,7 @@ def add_to_novels_list(name, link):
     # Remove copying mistakes
     name = clean_up_title(name)
 
-    novels_list = load_novels_list()
-    novels_list[name] = link
-    with open('novels_list.json', 'w') as f:
-        f.write(json.dumps(novels_list))
-        f.close()
+    get_catalog().add(name, link)
 
 
 def get_site_domain(url):
@@ -106,6 +219,58 @@ def get_site_domain(url):
     return urlparse(url).netloc
 
 
+def canonical_url(url):
+    """
+    normalizes a url so the same page always gives the same key
+    params:
+        str url
+    return:
+        canonical url: str
+    """
+    parser = urlparse(url.strip())
+    scheme = (parser.scheme or "https").lower()
+    if scheme == "http":
+        scheme = "https"
+    path = parser.path.rstrip('/') or '/'
+    canonical = f"{scheme}://{parser.netloc.lower()}{path}"
+    if parser.query:
+        canonical += "?" + parser.query
+    return canonical
+
+
+def unique_path(path, used_paths):
+    """
+    adds a number to a file path if it's already used
+    params:
+        str path
+        set used_paths
+    return:
+        path: str
+    """
+    if path not in used_paths:
+        return path
+    root, ext = os.path.splitext(path)
+    n = 2
+    while f"{root} ({n}){ext}" in used_paths:
+        n += 1
+    return f"{root} ({n}){ext}"
+
+
+# tables and patterns of the cleaning functions, built once
+_TEXT_DELETE = str.maketrans('', '', '\t\r')
+_NAME_DELETE = str.maketrans('', '', ':–-?"\\')
+_TITLE_BREAKS = re.compile(r'\n|/n')
+# quoted texts on one line, paired from the start of the line, with the
+# word character following the closing quote if there is one
+_QUOTED = re.compile(r'"([^"\n]*)"(?=(\w)?)')
+
+
+def _space_quote(match):
+    if match.group(2) is None:
+        return match.group(0)
+    return '"{}" '.format(match.group(1).strip())
+
+
 def clean_up_title(title):
     """
     cleans up title from extra spaces
@@ -114,34 +279,24 @@ def clean_up_title(title):
     return:
         clean_title: str
     """
-    clean_title = title.replace('\n', '')
-    clean_title = clean_title.replace('/n', '')
-    clean_title = clean_title.strip()
-    return clean_title
+    return _TITLE_BREAKS.sub('', title).strip()
 
 
 def clean_text(text):
     """
-    cleans text from wierd stuff
+    cleans text from wierd stuff\n
+    tabs and carriage returns are removed, new lines are kept as they
+    separate paragraphs
     params:
         str text
     return:
         clean_text: str
     """
-    # remove all escape characters
-    escape_chars = ['\n', '\t', '\r']
-    for char in escape_chars:
-        clean_text = text.replace(char, '')
-    # remove spaces at start and end
-    clean_text = clean_text.strip()
+    clean_text = text.translate(_TEXT_DELETE).strip()
 
     # add space after each double quote if there isn't one
     # and removes edge spaces inside them
-    double_quotes_no_space = re.findall(r'".*"\b', clean_text)
-    for i in double_quotes_no_space:
-        double_quotes_text = i[1:-2].strip()
-        clean_text = clean_text.replace(i, '"{}" '.format(double_quotes_text))
-    return clean_text
+    return _QUOTED.sub(_space_quote, clean_text)
 
 
 def clean_filename(name):
@@ -152,16 +307,7 @@ def clean_filename(name):
     return:
         file_name: str
     """
-    file_name = name.replace(':', '')
-    file_name = file_name.replace('–', '')
-    file_name = file_name.replace('-', '')
-    file_name = file_name.replace('?', '')
-    file_name = file_name.replace('\"', '')
-    file_name = file_name.replace('\\', '')
-    file_name = file_name.replace(':', '')
-    file_name = file_name.strip()
-    file_name += '.txt'
-    return file_name
+    return clean_foldername(name) + '.txt'
 
 
 def clean_foldername(name):
@@ -172,15 +318,7 @@ def clean_foldername(name):
     return:
         folder_name: str
     """
-    folder_name = name.replace(':', '')
-    folder_name = folder_name.replace('–', '')
-    folder_name = folder_name.replace('-', '')
-    folder_name = folder_name.replace('?', '')
-    folder_name = folder_name.replace('\"', '')
-    folder_name = folder_name.replace('\\', '')
-    folder_name = folder_name.replace(':', '')
-    folder_name = folder_name.strip()
-    return folder_name
+    return name.translate(_NAME_DELETE).strip()
 
 
 def is_absloute_url(url):
@@ -215,5 +353,103 @@ def realtive_to_absloute(url, site_domain=""):
         return "https://"+site_domain+url
 
 
+def get_page_number(elements):
+    """
+    gets a page number from the text or link of pagination elements
+    params:
+        list elements: html tags, the last one is used
+    return:
+        page number: int (None if not found)
+    """
+    if not elements:
+        return None
+    element = elements[-1]
+    text = element.get_text().strip()
+    if text.isdigit():
+        return int(text)
+    numbers = re.findall(r'\d+', element.get('href', '') or '')
+    if numbers:
+        return int(numbers[-1])
+    return None
+
+
+def file_hash(file_path):
+    """
+    hashes a file's content, hashes are kept until the file changes
+    params:
+        str file_path
+    return:
+        hash: str
+    """
+    stat = os.stat(file_path)
+    key = (file_path, stat.st_size, stat.st_mtime_ns)
+    with _file_hashes_lock:
+        if key in _file_hashes:
+            return _file_hashes[key]
+    file_sha = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 16), b''):
+            file_sha.update(block)
+        f.close()
+    with _file_hashes_lock:
+        _file_hashes[key] = file_sha.hexdigest()
+    return _file_hashes[key]
+
+
+def sync_asset(src, dst, link=False):
+    """
+    makes dst a copy of src, only copying files whose content changed
+    and removing files src doesn't have
+    params:
+        str src: file or folder
+        str dst: file or folder
+        bool link: hardlink files instead of copying them when possible
+    """
+    if os.path.isdir(src):
+        if os.path.isfile(dst):
+            os.remove(dst)
+        if not os.path.exists(dst):
+            os.makedirs(dst)
+        names = set(os.listdir(src))
+        for name in names:
+            sync_asset(os.path.join(src, name), os.path.join(dst, name),
+                       link)
+        for name in set(os.listdir(dst)) - names:
+            stale = os.path.join(dst, name)
+            if os.path.isdir(stale):
+                shutil.rmtree(stale)
+            else:
+                os.remove(stale)
+        return
+
+    if os.path.isdir(dst):
+        shutil.rmtree(dst)
+    if os.path.isfile(dst):
+        if os.path.samefile(src, dst) or file_hash(src) == file_hash(dst):
+            return
+
+    # replace dst in one step
+    with atomic_path(dst) as tmp_path:
+        linked = False
+        if link:
+            try:
+                os.link(src, tmp_path)
+                linked = True
+            except OSError:
+                # other filesystem or links not supported
+                pass
+        if not linked:
+            shutil.copy2(src, tmp_path)
+
+
+def folder_size(path):
+    """ total size of the files in a folder in bytes """
+    size = 0
+    for root, _, files in os.walk(path):
+        for file_name in files:
+            size += os.path.getsize(os.path.join(root, file_name))
+    return size
+
+
 def get_novel_path(novelName):
     return os.path.join(os.getcwd(), 'Novels', clean_foldername(novelName))
@@ -20,8 +20,8 @@ def main():
     app = App()
     app.show()
 
-#    handler = app.log
-#    rootLogger.addHandler(handler)
+    handler = app.log
+    root_logger.addHandler(handler)
 
     exit(root.exec_())
 
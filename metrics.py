@@ -0,0 +1,267 @@
+from contextlib import contextmanager
+import contextvars
+import os
+import json
+import time
+import bisect
+import logging
+import threading
+
+from atomic_write import write_file_atomic
+
+METRICS_FOLDER = os.path.join(os.getcwd(), 'Metrics')
+# prefix of every prometheus metric
+NAMESPACE = 'webnovels'
+# upper bounds in seconds of the stage histograms buckets
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30,
+           60, 300)
+
+# counters and their help text
+COUNTERS = {
+    'requests': "Requests sent per host and novel",
+    'bytes_downloaded': "Response bytes received per host and novel, "
+                        "as sent",
+    'retries': "Requests retried per host and novel",
+    'connections_opened': "Connections opened per host and novel",
+    'cache_hits': "Lookups answered by a cache, per novel",
+    'cache_misses': "Lookups a cache couldn't answer, per novel",
+}
+
+# novel the current thread works for, counted with every counter
+# threads of a pool don't inherit it, their tasks have to set it
+_current_novel = contextvars.ContextVar('novel', default=None)
+
+
+class Histogram():
+    """
+    Histogram Class - counts observations in fixed buckets\n
+    params:
+        tuple buckets: sorted upper bounds
+    """
+    __slots__ = ('buckets', 'counts', 'sum', 'count', 'max')
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        # last count is for observations above every bound
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+        self.max = max(self.max, value)
+
+    def cumulative(self):
+        """
+        gets the number of observations under each bound
+        return:
+            list[(bound, count)], last bound is '+Inf'
+        """
+        total = 0
+        counts = []
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            total += count
+            counts.append((bound, total))
+        return counts
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "mean": self.sum / self.count if self.count else 0.0,
+            "max": self.max,
+            "buckets": dict((str(bound), count)
+                            for bound, count in self.cumulative()),
+        }
+
+
+class Metrics():
+    """
+    Metrics Class - stages timings and counters of every run\n
+    each chapter's stage timing goes to the stage's histogram and to its
+    novel's totals
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.stages = {}
+            # {novel: {stage: [count, seconds]}}
+            self.novels = {}
+            # {(counter, label name, label value, novel): value}
+            self.counters = {}
+
+    def observe(self, stage, seconds, novel=None):
+        """
+        records the time a stage took
+        params:
+            str stage: 'fetch', 'parse', 'clean', 'save', 'export_html'...
+            float seconds
+            str novel: novel's name, for the novel's totals
+        """
+        with self.lock:
+            if stage not in self.stages:
+                self.stages[stage] = Histogram()
+            self.stages[stage].observe(seconds)
+            if novel is not None:
+                totals = self.novels.setdefault(novel, {})
+                total = totals.setdefault(stage, [0, 0.0])
+                total[0] += 1
+                total[1] += seconds
+
+    @contextmanager
+    def timer(self, stage, novel=None):
+        """ times the block as a stage """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start, novel)
+
+    @contextmanager
+    def novel(self, novel):
+        """ counts the block's counters for a novel """
+        token = _current_novel.set(novel)
+        try:
+            yield
+        finally:
+            _current_novel.reset(token)
+
+    def count(self, counter, value=1, **label):
+        """
+        adds to a counter, for the novel set with Metrics.novel if any
+        params:
+            str counter: one of COUNTERS
+            int value
+            label: one label, like host='example.com' or cache='content'
+        """
+        assert(counter in COUNTERS)
+        key = ((counter,) + next(iter(label.items()), ('', '')) +
+               (_current_novel.get(),))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def total(self, counter):
+        """
+        gets a counter summed over all its labels
+        params:
+            str counter: one of COUNTERS
+        return:
+            total: int
+        """
+        with self.lock:
+            return sum(total for key, total in self.counters.items()
+                       if key[0] == counter)
+
+    def summary(self):
+        """
+        gets every metric as json serializable data\n
+        counters are summed over novels, novel_counters has each
+        novel's share
+        return:
+            summary: dict{stages, novels, counters, novel_counters}
+        """
+        with self.lock:
+            counters = {}
+            novel_counters = {}
+            for (counter, _, value, novel), total in self.counters.items():
+                values = counters.setdefault(counter, {})
+                values[value or 'all'] = values.get(value or 'all', 0) + total
+                if novel is not None:
+                    values = novel_counters.setdefault(
+                        novel, {}).setdefault(counter, {})
+                    values[value or 'all'] = total
+            return {
+                "stages": dict((stage, histogram.summary())
+                               for stage, histogram in self.stages.items()),
+                "novels": dict(
+                    (novel, dict((stage, {"count": total[0],
+                                          "seconds": total[1]})
+                                 for stage, total in totals.items()))
+                    for novel, totals in self.novels.items()),
+                "counters": counters,
+                "novel_counters": novel_counters,
+            }
+
+    def prometheus(self):
+        """
+        gets every metric in prometheus text format
+        return:
+            text: str
+        """
+        lines = []
+        with self.lock:
+            name = f"{NAMESPACE}_stage_seconds"
+            lines.append(f"# HELP {name} Time spent per stage and chapter")
+            lines.append(f"# TYPE {name} histogram")
+            for stage, histogram in sorted(self.stages.items()):
+                labels = f'stage="{escape_label(stage)}"'
+                for bound, count in histogram.cumulative():
+                    lines.append(f'{name}_bucket{{{labels},le="{bound}"}} '
+                                 f'{count}')
+                lines.append(f"{name}_sum{{{labels}}} {histogram.sum}")
+                lines.append(f"{name}_count{{{labels}}} {histogram.count}")
+
+            name = f"{NAMESPACE}_novel_stage_seconds_total"
+            lines.append(f"# HELP {name} Time spent per novel and stage")
+            lines.append(f"# TYPE {name} counter")
+            for novel, totals in sorted(self.novels.items()):
+                for stage, total in sorted(totals.items()):
+                    lines.append(f'{name}{{novel="{escape_label(novel)}",'
+                                 f'stage="{escape_label(stage)}"}} '
+                                 f'{total[1]}')
+
+            for counter, help_text in COUNTERS.items():
+                name = f"{NAMESPACE}_{counter}_total"
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} counter")
+                for key, total in sorted(self.counters.items(),
+                                         key=lambda item: str(item[0])):
+                    if key[0] != counter:
+                        continue
+                    labels = []
+                    if key[1]:
+                        labels.append(f'{key[1]}="{escape_label(key[2])}"')
+                    if key[3] is not None:
+                        labels.append(f'novel="{escape_label(key[3])}"')
+                    labels = f"{{{','.join(labels)}}}" if labels else ''
+                    lines.append(f"{name}{labels} {total}")
+        return '\n'.join(lines) + '\n'
+
+    def export(self, folder=METRICS_FOLDER):
+        """
+        writes the json summary and the prometheus file of the metrics\n
+        the prometheus file can be read by node exporter's textfile
+        collector\n
+        params:
+            str folder: destination folder
+        return:
+            tuple:
+                json_path: str
+                prometheus_path: str
+        """
+        if not os.path.exists(folder):
+            os.makedirs(folder, exist_ok=True)
+        json_path = os.path.join(folder, 'metrics.json')
+        prometheus_path = os.path.join(folder, f'{NAMESPACE}.prom')
+        for path, text in ((json_path, json.dumps(self.summary(), indent=2)),
+                           (prometheus_path, self.prometheus())):
+            # scrapers never see a half written file
+            write_file_atomic(path, text)
+        logging.info("Metrics written to %s", folder)
+        return json_path, prometheus_path
+
+
+def escape_label(value):
+    """ escapes a prometheus label value """
+    return (str(value).replace('\\', '\\\\').replace('"', '\\"')
+            .replace('\n', '\\n'))
+
+
+# shared by the whole process
+metrics = Metrics()
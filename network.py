@@ -0,0 +1,508 @@
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.connectionpool import port_by_scheme
+from urllib.parse import urlparse
+from email.utils import parsedate_to_datetime
+import requests
+import threading
+import logging
+import random
+import json
+import time
+import os
+
+from novel_exceptions import PageLoadError, RateLimited, HostUnavailable
+from atomic_write import write_json_atomic
+from metrics import metrics
+
+# brotli is only decoded by urllib3 when one of these is installed
+try:
+    import brotli  # noqa: F401
+    ACCEPT_ENCODING = "gzip, deflate, br"
+except ImportError:
+    try:
+        import brotlicffi  # noqa: F401
+        ACCEPT_ENCODING = "gzip, deflate, br"
+    except ImportError:
+        ACCEPT_ENCODING = "gzip, deflate"
+
+# max concurrent requests sent to the same host, a novel's host_limit
+# raises it for the whole process
+HOST_CONCURRENCY = 4
+# number of hosts keeping a connection pool at the same time
+POOLED_HOSTS = 16
+# seconds to wait for connecting and for reading a response
+CONNECT_TIMEOUT = 10
+READ_TIMEOUT = 30
+TIMEOUT = (CONNECT_TIMEOUT, READ_TIMEOUT)
+
+# requests per second allowed to a host, lowered when it rate limits us
+HOST_RATE = 2.0
+HOST_MIN_RATE = 0.1
+HOST_BURST = 4
+# retries of a failed request, waiting BACKOFF_BASE * 2^try (with jitter)
+MAX_RETRIES = 4
+BACKOFF_BASE = 1
+BACKOFF_MAX = 60
+# statuses worth retrying, other errors fail right away
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+# failed pages in a row before a host is parked, and for how long
+BREAKER_THRESHOLD = 5
+BREAKER_COOLDOWN = 300
+
+_session = None
+_session_pool_size = 0
+_session_lock = threading.Lock()
+
+# ETag / Last-Modified of pages, used for conditional requests
+VALIDATORS_FILE = os.path.join(os.getcwd(), 'Cache', 'validators.json')
+_validators_lock = threading.Lock()
+
+
+def pool_host(pool):
+    """
+    gets the host of a connection pool as urlparse(link).netloc has it\n
+    params:
+        HTTPConnectionPool pool
+    return:
+        host: str
+    """
+    if pool.port in (None, port_by_scheme.get(pool.scheme)):
+        return pool.host
+    return "%s:%s" % (pool.host, pool.port)
+
+
+class CountingHTTPConnectionPool(HTTPConnectionPool):
+    """ http connection pool counting every new connection """
+    def _new_conn(self):
+        metrics.count('connections_opened', host=pool_host(self))
+        return super()._new_conn()
+
+
+class CountingHTTPSConnectionPool(HTTPSConnectionPool):
+    """ https connection pool counting every new connection """
+    def _new_conn(self):
+        metrics.count('connections_opened', host=pool_host(self))
+        return super()._new_conn()
+
+
+class PooledAdapter(HTTPAdapter):
+    """ keep-alive adapter with a pool per host sized to the concurrency """
+    def __init__(self, pool_size=HOST_CONCURRENCY):
+        super().__init__(pool_connections=POOLED_HOSTS,
+                         pool_maxsize=pool_size, pool_block=True)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": CountingHTTPConnectionPool,
+            "https": CountingHTTPSConnectionPool,
+        }
+
+
+class TokenBucket():
+    """
+    TokenBucket Class - limits the requests rate to a host
+
+    the rate is halved when the host rate limits us and slowly goes
+    back up with every successful request
+
+    params:
+        float rate: tokens added per second
+        int burst: max tokens saved
+    """
+    def __init__(self, rate=HOST_RATE, burst=HOST_BURST):
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.paused_until = 0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """ waits until a request can be sent """
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    wait = self.paused_until - now
+                else:
+                    self.tokens = min(self.burst, self.tokens +
+                                      (now - self.updated) * self.rate)
+                    self.updated = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """ stops every request to the host for some seconds """
+        with self.lock:
+            self.paused_until = max(self.paused_until,
+                                    time.monotonic() + seconds)
+            # one request is let through to probe the host after the pause
+            self.tokens = 1
+            self.updated = self.paused_until
+
+    def slow_down(self):
+        """ halves the rate after the host rate limited us """
+        with self.lock:
+            self.rate = max(HOST_MIN_RATE, self.rate / 2)
+
+    def speed_up(self):
+        """ raises the rate a little after a successful request """
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate * 1.1)
+
+
+class CircuitBreaker():
+    """
+    CircuitBreaker Class - parks a host that keeps failing
+
+    after threshold failed pages in a row requests to the host fail
+    right away until cooldown seconds passed, then one failure parks
+    it again while one success closes the breaker
+
+    params:
+        int threshold: failed pages in a row before parking the host
+        int cooldown: seconds the host stays parked
+    """
+    def __init__(self, threshold=BREAKER_THRESHOLD,
+                 cooldown=BREAKER_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.lock = threading.Lock()
+
+    def check(self, link):
+        """ raises HostUnavailable while the host is parked """
+        with self.lock:
+            if (self.opened_at is not None and
+               time.monotonic() - self.opened_at < self.cooldown):
+                raise HostUnavailable(link, "Host parked after "
+                                      f"{self.failures} failures")
+
+    def success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.failures >= self.threshold:
+                if self.opened_at is None:
+                    logging.warning("Parking host for %ds after %d failures",
+                                    self.cooldown, self.failures)
+                self.opened_at = time.monotonic()
+
+
+class HostSemaphore():
+    """
+    HostSemaphore Class - limits the concurrent requests to a host
+
+    the limit can be raised while requests are running, so every novel
+    on a host shares the largest limit asked for
+
+    params:
+        int limit: max concurrent requests
+    """
+    def __init__(self, limit=HOST_CONCURRENCY):
+        self.limit = limit
+        self.running = 0
+        self.condition = threading.Condition()
+
+    def raise_limit(self, limit):
+        """ raises the limit, a lower one is ignored """
+        with self.condition:
+            if limit > self.limit:
+                self.limit = limit
+                self.condition.notify_all()
+
+    def __enter__(self):
+        with self.condition:
+            while self.running >= self.limit:
+                self.condition.wait()
+            self.running += 1
+        return self
+
+    def __exit__(self, *exc_info):
+        with self.condition:
+            self.running -= 1
+            self.condition.notify()
+
+
+_hosts = {}
+_hosts_lock = threading.Lock()
+
+
+def get_host_limits(host):
+    """
+    gets the rate limiter and circuit breaker shared by a host
+
+    params:
+        str host: host's domain
+    return:
+        tuple:
+            bucket: TokenBucket
+            breaker: CircuitBreaker
+    """
+    with _hosts_lock:
+        if host not in _hosts:
+            _hosts[host] = (TokenBucket(), CircuitBreaker())
+        return _hosts[host]
+
+
+def retry_after(response):
+    """
+    gets the seconds to wait asked by a response's Retry-After header
+
+    params:
+        requests.Response response
+    return:
+        seconds: float (None if the header is missing or invalid)
+    """
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        date = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, date.timestamp() - time.time())
+
+
+def backoff(attempt):
+    """ exponential backoff with full jitter """
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+
+def fetch(session, link, retries=MAX_RETRIES, **kwargs):
+    """
+    sends a GET request under the host's rate limit
+
+    failed requests are retried with exponential backoff, a 429 or 503
+    also slows the host down and Retry-After is honored
+
+    params:
+        requests.Session session
+        str link
+        int retries: retries before giving up
+    return:
+        response: requests.Response (status below 400)
+    raises:
+        HostUnavailable: the host is parked by its circuit breaker
+        RateLimited: the host kept rate limiting every retry
+        PageLoadError: the page failed to load
+    """
+    host = urlparse(link).netloc
+    bucket, breaker = get_host_limits(host)
+    attempt = 0
+    while True:
+        breaker.check(link)
+        bucket.acquire()
+        try:
+            response = session_get(session, link, **kwargs)
+        except requests.RequestException as e:
+            response = None
+            error = PageLoadError(link, type(e).__name__)
+        else:
+            metrics.count('bytes_downloaded', transferred_bytes(response),
+                          host=host)
+            if response.status_code < 400:
+                bucket.speed_up()
+                breaker.success()
+                return response
+            if response.status_code not in RETRY_STATUSES:
+                # the page is missing or forbidden, the host is fine
+                raise PageLoadError(link, f"HTTP {response.status_code}",
+                                    response.status_code)
+            if response.status_code == 429:
+                error = RateLimited(link, "HTTP 429", 429)
+            else:
+                error = PageLoadError(link,
+                                      f"HTTP {response.status_code}",
+                                      response.status_code)
+
+        if attempt >= retries:
+            breaker.failure()
+            raise error
+
+        delay = backoff(attempt)
+        throttled = (response is not None and
+                     response.status_code in (429, 503))
+        if throttled:
+            bucket.slow_down()
+            asked = retry_after(response)
+            if asked is not None:
+                delay = asked
+        attempt += 1
+        metrics.count('retries', host=host)
+        logging.info("Retrying in %.1fs (%s)", delay, error)
+        if throttled:
+            # every request to the host waits, not only this one
+            bucket.pause(delay)
+        else:
+            time.sleep(delay)
+
+
+def configure_session(session, pool_size=HOST_CONCURRENCY):
+    """
+    mounts the pooled adapter and compression headers on a session\n
+    used for the shared session and for cloudflare scrapers\n
+    params:
+        requests.Session session
+        int pool_size: keep-alive connections kept per host
+    return:
+        session: requests.Session
+    """
+    adapter = PooledAdapter(pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers["Accept-Encoding"] = ACCEPT_ENCODING
+    return session
+
+
+def get_session(pool_size=HOST_CONCURRENCY):
+    """
+    gets the session shared by every normal page load\n
+    its pools are sized to the largest concurrency asked for, so threads
+    let through by a host's semaphore never wait for a connection\n
+    params:
+        int pool_size: keep-alive connections needed per host
+    return:
+        session: requests.Session
+    """
+    global _session, _session_pool_size
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+        if pool_size > _session_pool_size:
+            # requests running keep the pools of the replaced adapter
+            configure_session(_session, pool_size)
+            _session_pool_size = pool_size
+        return _session
+
+
+def session_get(session, link, **kwargs):
+    """
+    sends a GET request through a session with the default timeouts\n
+    params:
+        requests.Session session
+        str link
+    return:
+        response: requests.Response
+    """
+    kwargs.setdefault("timeout", TIMEOUT)
+    metrics.count('requests', host=urlparse(link).netloc)
+    return session.get(link, **kwargs)
+
+
+def transferred_bytes(response):
+    """
+    gets the bytes a response took on the wire, before decompression\n
+    params:
+        requests.Response response
+    return:
+        size: int
+    """
+    try:
+        # bytes urllib3 read from the connection, body is fully read
+        size = response.raw.tell()
+    except (AttributeError, OSError, ValueError):
+        size = 0
+    if not size:
+        size = int(response.headers.get('Content-Length') or 0)
+    return size
+
+
+def get_stats():
+    """
+    gets connection counters of every host from the metrics,
+    useful to check connection reuse\n
+    return:
+        stats: dict{requests, connections_opened, connections_reused,
+                    retries}
+    """
+    stats = {}
+    for counter in ('requests', 'connections_opened', 'retries'):
+        stats[counter] = metrics.total(counter)
+    stats["connections_reused"] = max(
+        0, stats["requests"] - stats["connections_opened"])
+    return stats
+
+
+def load_validators(link):
+    """
+    gets the stored validators of a page\n
+    params:
+        str link: page's link
+    return:
+        validators: dict{etag, last_modified} (empty if none stored)
+    """
+    with _validators_lock:
+        if not os.path.isfile(VALIDATORS_FILE):
+            return {}
+        with open(VALIDATORS_FILE, 'r') as f:
+            validators = json.load(f)
+            f.close()
+    return validators.get(link, {})
+
+
+def save_validators(link, validators):
+    """
+    stores the validators of a page in the validators file\n
+    params:
+        str link: page's link
+        dict validators: {etag, last_modified}
+    """
+    with _validators_lock:
+        stored = {}
+        if os.path.isfile(VALIDATORS_FILE):
+            with open(VALIDATORS_FILE, 'r') as f:
+                stored = json.load(f)
+                f.close()
+        if validators:
+            stored[link] = validators
+        else:
+            stored.pop(link, None)
+        write_json_atomic(VALIDATORS_FILE, stored)
+
+
+def validators_headers(validators):
+    """
+    turns stored validators into conditional request headers\n
+    params:
+        dict validators: {etag, last_modified}
+    return:
+        headers: dict
+    """
+    headers = {}
+    if validators.get('etag'):
+        headers['If-None-Match'] = validators['etag']
+    if validators.get('last_modified'):
+        headers['If-Modified-Since'] = validators['last_modified']
+    return headers
+
+
+def response_validators(response):
+    """
+    gets the validators sent with a response\n
+    params:
+        requests.Response response
+    return:
+        validators: dict{etag, last_modified}
+    """
+    validators = {}
+    if response.headers.get('ETag'):
+        validators['etag'] = response.headers['ETag']
+    if response.headers.get('Last-Modified'):
+        validators['last_modified'] = response.headers['Last-Modified']
+    return validators
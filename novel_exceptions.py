@@ -16,3 +16,22 @@ class NoChapterData(Exception):
 class NoChaptersPaths(Exception):
     "Raised when chapters paths file doesn't exist"
     pass
+
+
+class PageLoadError(Exception):
+    "Raised when a page couldn't be loaded"
+    def __init__(self, link, reason, status=None):
+        super().__init__(f"{reason}: {link}")
+        self.link = link
+        self.reason = reason
+        self.status = status
+
+
+class RateLimited(PageLoadError):
+    "Raised when a host kept rate limiting requests after every retry"
+    pass
+
+
+class HostUnavailable(PageLoadError):
+    "Raised when a host failed too often and is parked for a while"
+    pass
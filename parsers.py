@@ -0,0 +1,130 @@
+from bs4 import BeautifulSoup, SoupStrainer
+
+import re
+
+# lxml is much faster than python's html.parser but repairs broken html
+# differently, so sites opt in to it with site_data['parser']
+try:
+    import lxml  # noqa: F401
+    LXML_INSTALLED = True
+except ImportError:
+    LXML_INSTALLED = False
+DEFAULT_PARSER = "html.parser"
+
+PARSERS = ("lxml", "html.parser")
+
+# first compound of a selector that can be matched while parsing:
+# a tag name with an id and/or classes, no attributes or pseudo classes
+SIMPLE_COMPOUND = re.compile(
+    r"^(?P<tag>[a-zA-Z][\w-]*)(?P<rest>(?:[#.][\w-]+)*)$")
+# tags closed by their parent's end tag, parsed alone they would swallow
+# what follows them
+OPTIONAL_END_TAGS = frozenset((
+    'p', 'li', 'dt', 'dd', 'option', 'optgroup', 'tr', 'td', 'th',
+    'thead', 'tbody', 'tfoot', 'colgroup', 'caption', 'rb', 'rt', 'rp',
+    'rtc', 'html', 'head', 'body'))
+
+
+def get_parser(site_data):
+    """
+    gets the parser used for a site, can be set with site_data['parser']\n
+    lxml is only used when installed
+    params:
+        dict site_data
+    return:
+        parser: str
+    """
+    parser = site_data.get('parser', DEFAULT_PARSER)
+    if parser not in PARSERS or (parser == "lxml" and not LXML_INSTALLED):
+        return DEFAULT_PARSER
+    return parser
+
+
+def selector_strainer(css_selector):
+    """
+    creates a strainer keeping only the subtrees a selector can match\n
+    params:
+        str css_selector
+    return:
+        strainer: SoupStrainer (None if the whole page is needed)
+    """
+    # groups and sibling combinators on the first compound need the rest
+    # of the page
+    if ',' in css_selector:
+        return None
+    compounds = css_selector.strip().split()
+    if not compounds:
+        return None
+    first = SIMPLE_COMPOUND.match(compounds[0])
+    # without a tag name the matched element could be any tag
+    if first is None:
+        return None
+    # parsers lower case tag names, selectors match them in any case
+    tag = first.group('tag').lower()
+    if tag in OPTIONAL_END_TAGS:
+        return None
+    if len(compounds) > 1 and compounds[1] in ('+', '~'):
+        return None
+
+    attrs = {}
+    for part in re.findall(r"[#.][\w-]+", first.group('rest')):
+        if part[0] == '#':
+            attrs['id'] = part[1:]
+        else:
+            # only one class is checked, select filters the rest,
+            # a regex also matches tags with several classes
+            attrs['class'] = re.compile(
+                r"(^|\s)" + re.escape(part[1:]) + r"(\s|$)")
+    return SoupStrainer(tag, attrs)
+
+
+class StrainedSoup(BeautifulSoup):
+    """
+    partial parse noting when it stops matching a full parse\n
+    a strained element left unclosed is closed by its parent's end tag
+    in a full parse, parsed alone it goes on and swallows what follows
+    """
+    diverged = False
+
+    def handle_endtag(self, name, nsprefix=None):
+        # an end tag inside a kept element closing nothing kept closes an
+        # ancestor that wasn't parsed, and with it the kept element
+        if len(self.tagStack) > 1 and not any(
+                tag.name == name for tag in self.tagStack[1:]):
+            self.diverged = True
+        super().handle_endtag(name, nsprefix)
+
+
+def parse_page(html, parser=DEFAULT_PARSER, css_selector=None):
+    """
+    parses a page\n
+    params:
+        str html: page html
+        str parser: 'lxml' or 'html.parser'
+        str css_selector: if provided only parts it can match are parsed
+    return:
+        page: BeautifulSoup
+    """
+    strainer = None
+    if css_selector is not None:
+        strainer = selector_strainer(css_selector)
+    if strainer is None:
+        return BeautifulSoup(html, parser)
+    page = StrainedSoup(html, parser, parse_only=strainer)
+    if page.diverged:
+        # can't tell what the full parse closed, parse the whole page
+        return BeautifulSoup(html, parser)
+    return page
+
+
+def select(html, css_selector, parser=DEFAULT_PARSER):
+    """
+    gets the elements matching a selector, parsing only what it needs\n
+    params:
+        str html: page html
+        str css_selector
+        str parser: 'lxml' or 'html.parser'
+    return:
+        elements: list
+    """
+    return parse_page(html, parser, css_selector).select(css_selector)
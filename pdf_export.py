@@ -0,0 +1,66 @@
+from weasyprint import HTML, CSS
+from atomic_write import atomic_file
+
+import os
+import hashlib
+
+# templates a pdf part depends on
+PDF_TEMPLATES = ('pdf_novel.html', 'pdf_chapter.html',
+                 'pdf_base_light.html', 'pdf_base_dark.html')
+
+# pypdf is optional, pdfs are rendered in one piece without it
+try:
+    from pypdf import PdfWriter
+except ImportError:
+    PdfWriter = None
+
+# kept apart from classes.py, spawned worker processes import this module
+# to unpickle render_part
+
+
+def render_part(html, css_path, pdf_dst):
+    """
+    lays out a part of a novel as a pdf, runs in a worker process
+    params:
+        str html: part's html
+        str css_path: stylesheet path
+        str pdf_dst: part's pdf path
+    return:
+        pdf_dst: str
+    """
+    HTML(string=html).write_pdf(pdf_dst, stylesheets=[CSS(css_path)])
+    return pdf_dst
+
+
+def merge_parts(parts_paths, pdf_dst):
+    """
+    merges pdf parts in order, keeping their bookmarks
+    params:
+        list parts_paths: parts pdf paths in order
+        str pdf_dst: merged pdf path
+    """
+    writer = PdfWriter()
+    for part_path in parts_paths:
+        # bookmarks are moved to the part's pages in the merged file
+        writer.append(part_path, import_outline=True)
+    with atomic_file(pdf_dst, 'wb') as f:
+        writer.write(f)
+    writer.close()
+
+
+def pdf_template_version(css_path):
+    """
+    hashes the pdf templates and stylesheet, parts rendered with other
+    versions of them can't be reused
+    params:
+        str css_path: stylesheet path
+    return:
+        version: str
+    """
+    templates_folder = os.path.dirname(css_path)
+    version = hashlib.sha256()
+    for file_name in PDF_TEMPLATES + (os.path.basename(css_path),):
+        with open(os.path.join(templates_folder, file_name), 'rb') as f:
+            version.update(f.read())
+            f.close()
+    return version.hexdigest()
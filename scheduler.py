@@ -0,0 +1,138 @@
+from helper_functions import load_novels_list, get_site_domain
+from metrics import metrics
+
+import time
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+# novels updated at the same time
+BATCH_WORKERS = 8
+# novels of the same domain updated at the same time
+DOMAIN_LIMIT = 2
+
+
+class BatchUpdater():
+    """
+    BatchUpdater Class - updates every novel in the library catalog\n
+    novels on different domains run in parallel, each domain runs at
+    most domain_limit novels at once\n
+    params:
+        int workers: novels updated at the same time
+        int domain_limit: novels per domain updated at the same time
+        int novel_workers: chapters fetched at the same time per novel
+    """
+    def __init__(self, workers=BATCH_WORKERS, domain_limit=DOMAIN_LIMIT,
+                 novel_workers=None):
+        self.workers = max(1, workers)
+        self.domain_limit = max(1, domain_limit)
+        self.novel_workers = novel_workers
+
+    def update_novel(self, name):
+        """
+        updates and saves a novel
+        params:
+            str name: novel's name
+        return:
+            fetched: int number of new chapters
+        """
+        # imported here so the scheduler can be used without the exports
+        from classes import Novel
+
+        kwrgs = {'load': True}
+        if self.novel_workers is not None:
+            kwrgs['workers'] = self.novel_workers
+        novel = Novel(name, **kwrgs)
+        novel.initialize()
+        chapters_count = len(novel.chapters)
+        # unchanged novels are left as they are on disk
+        if novel.update():
+            novel.save()
+        return len(novel.chapters) - chapters_count
+
+    def run(self, names=None):
+        """
+        updates novels under the global and per domain limits
+        params:
+            list names: novels to update, all novels if None
+        return:
+            summary: dict{checked, updated, chapters_fetched,
+                          failures: dict{name: error}, seconds}
+        """
+        novels_list = load_novels_list()
+        if names is None:
+            names = list(novels_list.keys())
+
+        # novels waiting per domain, domains are served in turns
+        queues = {}
+        for name in names:
+            domain = get_site_domain(novels_list.get(name) or '')
+            queues.setdefault(domain, deque()).append(name)
+        running = dict.fromkeys(queues, 0)
+
+        summary = {"checked": 0, "updated": 0, "chapters_fetched": 0,
+                   "failures": {}, "seconds": 0}
+        start = time.perf_counter()
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = {}
+
+            def fill():
+                submitted = True
+                while submitted and len(futures) < self.workers:
+                    submitted = False
+                    for domain, queue in queues.items():
+                        if len(futures) >= self.workers:
+                            break
+                        if queue and running[domain] < self.domain_limit:
+                            name = queue.popleft()
+                            running[domain] += 1
+                            future = executor.submit(self.update_novel, name)
+                            futures[future] = (domain, name)
+                            submitted = True
+
+            fill()
+            while futures:
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    domain, name = futures.pop(future)
+                    running[domain] -= 1
+                    summary["checked"] += 1
+                    try:
+                        fetched = future.result()
+                    except Exception as e:
+                        logging.error("Updating %s failed: %s", name, e)
+                        summary["failures"][name] = str(e)
+                        continue
+                    if fetched > 0:
+                        summary["updated"] += 1
+                        summary["chapters_fetched"] += fetched
+                    logging.info("Updated %s (%d/%d), %d new chapters",
+                                 name, summary["checked"], len(names),
+                                 fetched)
+                fill()
+
+        summary["seconds"] = time.perf_counter() - start
+        logging.info("Batch update: %d novels checked, %d updated, "
+                     "%d chapters fetched, %d failures in %.1fs",
+                     summary["checked"], summary["updated"],
+                     summary["chapters_fetched"], len(summary["failures"]),
+                     summary["seconds"])
+        metrics.export()
+        return summary
+
+
+def main():
+    """ updates the whole library, can be run from a scheduled task """
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Update every novel")
+    parser.add_argument('--workers', type=int, default=BATCH_WORKERS)
+    parser.add_argument('--domain-limit', type=int, default=DOMAIN_LIMIT)
+    args = parser.parse_args()
+
+    BatchUpdater(args.workers, args.domain_limit).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1 @@
+novelChapterLoaded({{ chapter_number }}, {{ chapter_html|tojson }});
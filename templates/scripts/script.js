@@ -1,10 +1,16 @@
 $(document).ready(function() {
     var novel_data_element = $("#novel_data")[0]
     var novel_name = novel_data_element.dataset.novelName
+    // chapters loaded before and after the one being read in split exports
+    var chapters_around = 2
+    // loaded chapters further than this from the one being read are unloaded
+    var chapters_kept = 6
+    var loaded_chapters = new Set();
 
     function go_to_current_chapter() {
         var current_chapter = $('[data-chapter-title="' + localStorage.getItem(novel_name) + '"]')
-        if (current_chapter != null) {
+        if (current_chapter[0] != null) {
+            load_chapters_around(current_chapter[0]);
             current_chapter[0].scrollIntoView();
         }
     }
@@ -20,11 +26,69 @@ $(document).ready(function() {
         localStorage.setItem("dark-mode", false);
         return
     }
+
+    // split exports keep each chapter in its own script file,
+    // scripts can be loaded from the disk unlike fetch requests
+    function load_chapter(chapter) {
+        if (chapter == null || !chapter.classList.contains('pending') || chapter.dataset.loading) {
+            return
+        }
+        chapter.dataset.loading = true;
+        var script = document.createElement('script');
+        script.src = chapter.dataset.chapterSrc;
+        script.onload = function() { script.remove(); };
+        document.head.appendChild(script);
+    }
+
+    // turns a chapter back into a placeholder of the same height so the
+    // page doesn't move and the DOM only holds chapters near the reader,
+    // the 100vh minimum is only for chapters never loaded
+    function unload_chapter(number) {
+        var chapter = document.getElementById('chapter-' + number);
+        chapter.style.height = chapter.offsetHeight + 'px';
+        chapter.style.minHeight = '0';
+        chapter.innerHTML = '';
+        chapter.classList.add('pending');
+        delete chapter.dataset.loading;
+        loaded_chapters.delete(number);
+    }
+
+    function load_chapters_around(chapter) {
+        if (chapter.dataset.chapterSrc == null) {
+            return
+        }
+        var number = parseInt(chapter.dataset.chapterTitle);
+        for (var n = number - chapters_around; n <= number + chapters_around; n++) {
+            load_chapter(document.getElementById('chapter-' + n));
+        }
+        loaded_chapters.forEach(function(loaded) {
+            if (Math.abs(loaded - number) > chapters_kept) {
+                unload_chapter(loaded);
+            }
+        });
+    }
+
+    window.novelChapterLoaded = function(number, html) {
+        var chapter = document.getElementById('chapter-' + number);
+        // keep the reading position when a chapter above it grows
+        var top = chapter.getBoundingClientRect().top;
+        var height = chapter.offsetHeight;
+        chapter.innerHTML = html;
+        chapter.style.height = '';
+        chapter.style.minHeight = '';
+        chapter.classList.remove('pending');
+        loaded_chapters.add(number);
+        if (top < 0) {
+            window.scrollBy(0, chapter.offsetHeight - height);
+        }
+    }
+
     var observer = new IntersectionObserver(
         function(entries, observer) {
             entries.forEach(function(entry) {
                 if (entry.isIntersecting) {
                     localStorage.setItem(novel_name, entry.target.dataset.chapterTitle);
+                    load_chapters_around(entry.target);
                 }
             });
         }, { rootMargin: '0px 0px 0px 0px' });
@@ -0,0 +1,57 @@
+import pytest
+
+from helper_functions import clean_text, clean_up_title
+from helper_functions import clean_filename, clean_foldername
+
+
+@pytest.mark.parametrize('text, expected', [
+    # paragraphs stay on their own lines
+    ("First line.\nSecond line.", "First line.\nSecond line."),
+    # tabs and carriage returns are removed, not turned into spaces
+    ("\tFirst line.\r\nSecond\t line.\r\n", "First line.\nSecond line."),
+    ("tab\tbed\rtext", "tabbedtext"),
+    # edge spaces are removed
+    ("   spaced out  \n", "spaced out"),
+    # a quote followed by a word gets a space and loses inner edge spaces
+    ('"Hello "world.', '"Hello" world.'),
+    ('He said " hi"and left.', 'He said "hi" and left.'),
+    # quotes already followed by a space or punctuation are untouched
+    ('"Hello" world. "Bye", he said.', '"Hello" world. "Bye", he said.'),
+    ('" spaced " inside', '" spaced " inside'),
+    # closing quotes are never paired with the next opening one
+    ('He said "hi" and "bye"now.', 'He said "hi" and "bye" now.'),
+    ('"a"b "c"d', '"a" b "c" d'),
+    # quotes are paired on each line
+    ('"one\ntwo"three', '"one\ntwo"three'),
+    ('"x"y\n"z"w', '"x" y\n"z" w'),
+    ("", ""),
+])
+def test_clean_text(text, expected):
+    assert clean_text(text) == expected
+
+
+@pytest.mark.parametrize('title, expected', [
+    ("\n  Chapter 1: Start \n", "Chapter 1: Start"),
+    ("Chapter 2/n", "Chapter 2"),
+    ("Chapter\n3", "Chapter3"),
+    ("Chapter 4 - The End", "Chapter 4 - The End"),
+])
+def test_clean_up_title(title, expected):
+    assert clean_up_title(title) == expected
+
+
+@pytest.mark.parametrize('name, expected', [
+    ("Chapter 1: Start", "Chapter 1 Start.txt"),
+    ('Who? "Me" \\ – - end ', "Who Me    end.txt"),
+    ("  plain  ", "plain.txt"),
+])
+def test_clean_filename(name, expected):
+    assert clean_filename(name) == expected
+
+
+@pytest.mark.parametrize('name, expected', [
+    ("Novel: Part-One?", "Novel PartOne"),
+    ('  "Quoted" \\ name ', "Quoted  name"),
+])
+def test_clean_foldername(name, expected):
+    assert clean_foldername(name) == expected
@@ -0,0 +1,107 @@
+from bs4 import BeautifulSoup
+import os
+import pytest
+
+from parsers import select, get_parser, selector_strainer
+from parsers import DEFAULT_PARSER, LXML_INSTALLED
+
+PAGES_FOLDER = os.path.join(os.path.dirname(__file__), 'pages')
+
+# (page, selector) pairs in the form used by sites data
+CASES = [
+    ('chapter.html', 'div.chapter-content p'),
+    ('chapter.html', '#chapter-content p'),
+    ('chapter.html', '.chapter-content p'),
+    ('chapter.html', 'div#c p'),
+    ('chapter.html', 'DIV.b p'),
+    ('chapter.html', 'div.b > h1.chapter-title'),
+    ('chapter.html', 'div.chapter-content.text-left p'),
+    ('chapter.html', 'p'),
+    ('chapter.html', 'div.ads p, h1'),
+    ('chapter.html', 'h1 + div p'),
+    ('chapter.html', 'div.missing p'),
+    ('index.html', 'ul.list-chapter li a'),
+    ('index.html', '#chapter-list a'),
+    ('index.html', 'li.locked a'),
+    ('index.html', 'li a'),
+    ('index.html', 'img.cover'),
+    ('index.html', '.desc'),
+    ('index.html', 'div.pagination a.last'),
+]
+
+
+def load_page(name):
+    with open(os.path.join(PAGES_FOLDER, name), 'r') as f:
+        html = f.read()
+        f.close()
+    return html
+
+
+def full_parse(html, css_selector):
+    """ extraction before partial parsing: whole page with html.parser """
+    return BeautifulSoup(html, 'html.parser').select(css_selector)
+
+
+@pytest.mark.parametrize('page, css_selector', CASES)
+def test_select_matches_full_parse(page, css_selector):
+    html = load_page(page)
+    expected = full_parse(html, css_selector)
+    elements = select(html, css_selector)
+    assert [str(e) for e in elements] == [str(e) for e in expected]
+    assert ([e.get_text() for e in elements] ==
+            [e.get_text() for e in expected])
+
+
+def test_unclosed_paragraphs_kept_as_html_parser_reads_them():
+    html = "<div id='c'><p>one<p>two</div>"
+    texts = [e.get_text() for e in select(html, '#c p')]
+    assert texts == ['onetwo', 'two']
+
+
+def test_default_parser():
+    assert DEFAULT_PARSER == 'html.parser'
+    assert get_parser({}) == 'html.parser'
+    assert get_parser({'parser': 'unknown'}) == 'html.parser'
+
+
+def test_lxml_opt_in():
+    expected = 'lxml' if LXML_INSTALLED else 'html.parser'
+    assert get_parser({'parser': 'lxml'}) == expected
+
+
+@pytest.mark.parametrize('css_selector', [
+    'p', 'li.locked a', '.chapter-content p', '#chapter-content p',
+    'div.ads p, h1', 'h1 + div p', 'div[data-x] p'])
+def test_full_parse_when_strainer_is_unsafe(css_selector):
+    assert selector_strainer(css_selector) is None
+
+
+@pytest.mark.parametrize('css_selector', [
+    'div.chapter-content p', 'DIV.b p', 'div#c p', 'ul.list-chapter li a'])
+def test_partial_parse(css_selector):
+    assert selector_strainer(css_selector) is not None
+
+
+# kept elements left open, closed in a full parse by an ancestor's end tag
+UNCLOSED_PAGES = [
+    ('<section><div class="content"><p>story</p></section>'
+     '<div class="footer"><p>Read at example.com</p></div>',
+     'div.content p'),
+    ('<section><div class="content"><p>story</p></section>'
+     '<div class="footer">ad</div></div>', 'div.content'),
+    ('<td><div class="content"><b>story</td><div class="footer">ad</div>',
+     'div.content b'),
+]
+
+
+@pytest.mark.parametrize('html, css_selector', UNCLOSED_PAGES)
+def test_unclosed_kept_element_matches_full_parse(html, css_selector):
+    expected = full_parse(html, css_selector)
+    elements = select(html, css_selector)
+    assert [str(e) for e in elements] == [str(e) for e in expected]
+
+
+def test_footer_not_in_unclosed_content():
+    html, css_selector = UNCLOSED_PAGES[0]
+    texts = [e.get_text() for e in select(html, css_selector)]
+    assert texts == ['story']